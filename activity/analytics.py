@@ -1,10 +1,11 @@
 from __future__ import annotations
 
+import heapq
 import threading
 import time
 from collections import Counter
 from dataclasses import dataclass, field
-from typing import Iterable
+from operator import itemgetter
 
 
 @dataclass
@@ -13,78 +14,217 @@ class _Bucket:
     counts: Counter[str] = field(default_factory=Counter)
 
 
+@dataclass
+class _Shard:
+    """
+    One lock stripe of a SlidingWindowTop: its own bucket ring and running total.
+    """
+
+    buckets: list[_Bucket]
+    total: Counter[str] = field(default_factory=Counter)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    # Evicting buckets leaves zero entries behind in `total`; they are swept
+    # lazily (see SlidingWindowTop._maybe_compact) instead of on every add()/top().
+    dirty: bool = False
+    last_compact_size: int = 0
+    # Entries subtracted out since the last compaction: an upper bound on how many
+    # keys in `total` are dead. Drives shrinking when the window thins out.
+    evicted: int = 0
+    # Newest bucket id _expire_old has run for; later calls in the same tick are no-ops.
+    last_expired_bucket: int = -1
+
+    # Bumped on any change that could alter the cached top-K (see SlidingWindowTop.top).
+    version: int = 0
+
+
 class SlidingWindowTop:
     """
     Sliding window frequency counter using a ring of time buckets.
 
     - bucket_size_seconds controls granularity (smaller => more accurate, more buckets).
     - window_seconds controls the window length.
+    - num_shards stripes keys across independent locks so concurrent writers rarely contend.
     - Keys are arbitrary strings (object_id, verb, etc.).
     """
 
-    def __init__(self, *, window_seconds: int, bucket_size_seconds: int = 5) -> None:
+    def __init__(self, *, window_seconds: int, bucket_size_seconds: int = 5, num_shards: int = 16) -> None:
         if window_seconds <= 0:
             raise ValueError("window_seconds must be > 0")
         if bucket_size_seconds <= 0:
             raise ValueError("bucket_size_seconds must be > 0")
+        if num_shards <= 0 or num_shards & (num_shards - 1):
+            raise ValueError("num_shards must be a power of two")
 
         self.window_seconds = int(window_seconds)
         self.bucket_size_seconds = int(bucket_size_seconds)
         self.num_buckets = max(1, (self.window_seconds + self.bucket_size_seconds - 1) // self.bucket_size_seconds)
 
-        self._buckets: list[_Bucket] = [_Bucket() for _ in range(self.num_buckets)]
-        self._total: Counter[str] = Counter()
-        self._lock = threading.Lock()
+        # The ring is rounded up to a power of two so slot lookup is a mask, not a
+        # modulo. Expiry still uses num_buckets, so the window length is unchanged;
+        # the spare slots just sit empty.
+        ring_size = 1 << (self.num_buckets - 1).bit_length()
+        self._ring_mask = ring_size - 1
+
+        self._shards: list[_Shard] = [
+            _Shard(buckets=[_Bucket() for _ in range(ring_size)]) for _ in range(num_shards)
+        ]
+        self._shard_mask = num_shards - 1
+
+        # Cached top() result: (k, bucket_id, shard versions, pairs). It stays valid
+        # until an eviction, or an add() that lifts a key to at least the K-th count
+        # (_topk_threshold), bumps a shard version. Recomputes are serialized so the
+        # threshold and the cache are published together.
+        self._topk_cache: tuple[int, int, list[int], list[tuple[str, int]]] | None = None
+        self._topk_threshold = 0
+        self._topk_lock = threading.Lock()
 
     def _current_bucket_id(self, ts: float) -> int:
         return int(ts // self.bucket_size_seconds)
 
-    def _expire_old(self, now_ts: float) -> None:
+    def _shard_for(self, key: str) -> _Shard:
+        return self._shards[hash(key) & self._shard_mask]
+
+    def _expire_old(self, shard: _Shard, now_ts: float) -> None:
         """
         Drop buckets that are older than the window relative to now_ts.
         """
 
         current_bucket = self._current_bucket_id(now_ts)
+        if current_bucket <= shard.last_expired_bucket:
+            # Nothing can have aged out since the pass made at this (or a later) tick.
+            return
+        shard.last_expired_bucket = current_bucket
+
         min_valid = current_bucket - (self.num_buckets - 1)
-        for b in self._buckets:
+        for b in shard.buckets:
             if b.bucket_id is None:
                 continue
             if b.bucket_id < min_valid:
                 if b.counts:
-                    self._total.subtract(b.counts)
+                    shard.total.subtract(b.counts)
+                    shard.dirty = True
+                    shard.evicted += len(b.counts)
+                    shard.version += 1
                 b.counts.clear()
                 b.bucket_id = None
 
-        # Counter can keep zero/negative entries; clean occasionally.
-        if len(self._total) > 0:
-            for k in [k for k, v in self._total.items() if v <= 0]:
-                del self._total[k]
+        self._maybe_compact(shard)
+
+    def _maybe_compact(self, shard: _Shard) -> None:
+        """
+        Rebuild a shard's total from its live buckets once stale keys dominate it.
+
+        Triggers when the total has grown well past its last compacted size, or when
+        roughly 3/4 of it could be dead. Deleting keys never shrinks a dict's table, so
+        the rebuild into a fresh Counter is also what hands memory back after a burst.
+        """
+
+        if not shard.dirty:
+            return
+        size = len(shard.total)
+        if size <= 2 * shard.last_compact_size + 64 and shard.evicted * 4 < size * 3:
+            return
+
+        # Summing the live buckets is cheaper than filtering when most keys are stale.
+        total: Counter[str] = Counter()
+        for b in shard.buckets:
+            if b.counts:
+                total.update(b.counts)
+        shard.total = total
+        shard.dirty = False
+        shard.last_compact_size = len(total)
+        shard.evicted = 0
 
     def add(self, key: str, *, ts: float | None = None, n: int = 1) -> None:
         if not key or n <= 0:
             return
         ts = time.time() if ts is None else float(ts)
         bucket_id = self._current_bucket_id(ts)
-        idx = bucket_id % self.num_buckets
-
-        with self._lock:
-            self._expire_old(ts)
-            bucket = self._buckets[idx]
-            if bucket.bucket_id != bucket_id:
-                # The ring slot is being reused; remove its old contribution.
-                if bucket.counts:
-                    self._total.subtract(bucket.counts)
-                bucket.counts.clear()
-                bucket.bucket_id = bucket_id
+        shard = self._shard_for(key)
 
+        with shard.lock:
+            self._expire_old(shard, ts)
+            if self._is_expired(shard, bucket_id):
+                return
+            bucket = self._claim_bucket(shard, bucket_id)
             bucket.counts[key] += n
-            self._total[key] += n
+            shard.total[key] += n
+            if shard.total[key] >= self._topk_threshold:
+                shard.version += 1
+
+    def _is_expired(self, shard: _Shard, bucket_id: int) -> bool:
+        """
+        True if bucket_id is already outside the window the shard has expired up to
+        (an out-of-order add). Such adds are dropped rather than resurrecting a bucket
+        that no expiry pass would revisit until the next tick.
+        """
+
+        return bucket_id < shard.last_expired_bucket - (self.num_buckets - 1)
+
+    def _claim_bucket(self, shard: _Shard, bucket_id: int) -> _Bucket:
+        """
+        Return the ring slot for bucket_id, recycling it if it still holds an older bucket.
+        """
+
+        bucket = shard.buckets[bucket_id & self._ring_mask]
+        if bucket.bucket_id != bucket_id:
+            # The ring slot is being reused; remove its old contribution.
+            if bucket.counts:
+                shard.total.subtract(bucket.counts)
+                shard.dirty = True
+                shard.evicted += len(bucket.counts)
+                shard.version += 1
+            bucket.counts.clear()
+            bucket.bucket_id = bucket_id
+        return bucket
 
     def top(self, *, k: int = 100, now_ts: float | None = None) -> list[tuple[str, int]]:
+        if k <= 0:
+            # Counter.most_common(k) semantics.
+            return []
         now_ts = time.time() if now_ts is None else float(now_ts)
-        with self._lock:
-            self._expire_old(now_ts)
-            return [(key, int(count)) for key, count in self._total.most_common(k)]
+        bucket_id = self._current_bucket_id(now_ts)
+
+        cached = self._topk_cache
+        if (
+            cached is not None
+            and cached[0] == k
+            and cached[1] == bucket_id
+            and cached[2] == [shard.version for shard in self._shards]
+        ):
+            return list(cached[3])
+
+        with self._topk_lock:
+            # Until the new cache is published, every add() must invalidate it.
+            self._topk_threshold = 0
+
+            # Shards partition the key space, so their totals can be concatenated
+            # rather than summed. Each lock is held only long enough to snapshot.
+            items: list[tuple[str, int]] = []
+            versions: list[int] = []
+            for shard in self._shards:
+                with shard.lock:
+                    self._expire_old(shard, now_ts)
+                    # Uncompacted entries may be zero; they must not surface as "top" keys.
+                    if shard.dirty:
+                        items.extend(kv for kv in shard.total.items() if kv[1] > 0)
+                    else:
+                        items.extend(shard.total.items())
+                    versions.append(shard.version)
+
+            if k >= len(items) // 2:
+                # Selecting most of the keys anyway: a single sort is cheaper than a heap.
+                pairs = sorted(items, key=itemgetter(1), reverse=True)[:k]
+            else:
+                # O(n log k): only k candidates are kept in the heap.
+                pairs = heapq.nlargest(k, items, key=itemgetter(1))
+            result = [(key, int(count)) for key, count in pairs]
+
+            self._topk_cache = (k, bucket_id, versions, result)
+            # With fewer than k keys, any new key changes the answer.
+            self._topk_threshold = result[-1][1] if len(result) >= k else 0
+            return list(result)
 
 
 class ActivityAnalytics:
@@ -106,11 +246,19 @@ class ActivityAnalytics:
             "1h": SlidingWindowTop(window_seconds=3600, bucket_size_seconds=5),
         }
 
+        # record() runs once per ingested event: bind the window methods up front
+        # instead of walking dict views and resolving attributes every call.
+        self._object_id_adds = tuple(w.add for w in self._by_object_id.values())
+        self._verb_adds = tuple(w.add for w in self._by_verb.values())
+
     def record(self, *, object_id: str, verb: str, ts: float | None = None) -> None:
-        for w in self._by_object_id.values():
-            w.add(object_id, ts=ts)
-        for w in self._by_verb.values():
-            w.add(verb, ts=ts)
+        if ts is None:
+            # Resolve the clock once so all six windows agree on the timestamp.
+            ts = time.time()
+        for add in self._object_id_adds:
+            add(object_id, ts=ts)
+        for add in self._verb_adds:
+            add(verb, ts=ts)
 
     def top(self, *, window: str, by: str = "object_id", k: int = 100) -> list[tuple[str, int]]:
         if by == "object_id":
@@ -1,12 +1,21 @@
 from __future__ import annotations
 
 import base64
+import binascii
 import json
+import struct
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import UTC, datetime, timedelta
 
 from django.utils.dateparse import parse_datetime
 
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
 
 @dataclass(frozen=True)
 class FeedCursor:
@@ -14,24 +23,31 @@ class FeedCursor:
     feed_item_id: int
 
 
+# Cursor wire format: big-endian (created_at as epoch microseconds, feed_item_id).
+# 16 bytes => a fixed 22-char urlsafe base64 token.
+_CURSOR_STRUCT = struct.Struct(">qQ")
+_EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+_ONE_MICROSECOND = timedelta(microseconds=1)
+
+
 def encode_feed_cursor(created_at: datetime, feed_item_id: int) -> str:
-    payload = {
-        "created_at": created_at.isoformat(),
-        "feed_item_id": int(feed_item_id),
-    }
-    raw = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
-    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+    # Integer timedelta division keeps microseconds exact (float timestamps can drift by 1us,
+    # which would break the created_at equality tie-break in the feed query).
+    micros = (created_at - _EPOCH) // _ONE_MICROSECOND
+    raw = _CURSOR_STRUCT.pack(micros, int(feed_item_id))
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
 
 
-def decode_feed_cursor(cursor: str) -> FeedCursor | None:
-    if not cursor:
-        return None
+def _decode_legacy_json_cursor(raw: bytes) -> tuple[datetime, int] | None:
+    """
+    Decode cursors issued before the binary format (base64 of a JSON object).
+    """
 
-    padded = cursor + "=" * (-len(cursor) % 4)
     try:
-        raw = base64.urlsafe_b64decode(padded.encode("ascii"))
-        payload = json.loads(raw.decode("utf-8"))
-    except Exception:
+        payload = _json_loads(raw)
+    except (UnicodeDecodeError, ValueError):
+        return None
+    if not isinstance(payload, dict):
         return None
 
     created_at_raw = payload.get("created_at")
@@ -39,7 +55,10 @@ def decode_feed_cursor(cursor: str) -> FeedCursor | None:
     if created_at_raw is None or feed_item_id_raw is None:
         return None
 
-    dt = parse_datetime(created_at_raw)
+    try:
+        dt = parse_datetime(created_at_raw)
+    except (TypeError, ValueError):
+        return None
     if dt is None:
         return None
 
@@ -47,9 +66,32 @@ def decode_feed_cursor(cursor: str) -> FeedCursor | None:
         fid = int(feed_item_id_raw)
     except (TypeError, ValueError):
         return None
+    return dt, fid
+
+
+def decode_feed_cursor(cursor: str) -> FeedCursor | None:
+    if not cursor:
+        return None
+
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(padded.encode("ascii"))
+    except (UnicodeEncodeError, binascii.Error, ValueError):
+        return None
+
+    if len(raw) == _CURSOR_STRUCT.size:
+        micros, fid = _CURSOR_STRUCT.unpack(raw)
+        try:
+            dt = _EPOCH + timedelta(microseconds=micros)
+        except OverflowError:
+            return None
+    else:
+        decoded = _decode_legacy_json_cursor(raw)
+        if decoded is None:
+            return None
+        dt, fid = decoded
 
     if fid <= 0:
         return None
 
     return FeedCursor(created_at=dt, feed_item_id=fid)
-
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import random
 import time
+from itertools import repeat
 from typing import Iterable
 
 from django.core.management.base import BaseCommand
@@ -16,6 +17,54 @@ def _chunks(seq: list, size: int) -> Iterable[list]:
         yield seq[i : i + size]
 
 
+def _table(model) -> str:
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+_EVENT_COLUMNS = "actor_id, verb, object_type, object_id, created_at"
+
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_text(value) -> str:
+    return str(value).translate(_COPY_ESCAPES)
+
+
+def _can_copy() -> bool:
+    """
+    True if rows can be streamed with COPY: PostgreSQL through psycopg 3, whose
+    cursor.copy() this relies on. psycopg2 has no such API.
+    """
+
+    return connection.vendor == "postgresql" and connection.Database.__name__ == "psycopg"
+
+
+def _bulk_copy_events(cur, rows: list[tuple]) -> None:
+    """
+    Insert (actor_id, verb, object_type, object_id, created_at) rows without the ORM.
+
+    When _can_copy() this streams through COPY, which skips per-row statement parsing.
+    Rows are rendered straight into COPY's text format; created_at is expected to be
+    a pre-rendered timestamp literal so nothing is adapted per row.
+    Otherwise it falls back to a single prepared executemany().
+    """
+
+    if _can_copy():
+        payload = "".join(
+            f"{actor_id}\t{_copy_text(verb)}\t{_copy_text(object_type)}\t{_copy_text(object_id)}\t{created_at}\n"
+            for actor_id, verb, object_type, object_id, created_at in rows
+        )
+        with cur.cursor.copy(f"COPY {_table(Event)} ({_EVENT_COLUMNS}) FROM STDIN") as copy:
+            copy.write(payload)
+        return
+
+    cur.executemany(
+        f"INSERT INTO {_table(Event)} ({_EVENT_COLUMNS}) VALUES (%s, %s, %s, %s, %s)",
+        rows,
+    )
+
+
 class Command(BaseCommand):
     help = "Seed the database with events + feed_items + notifications for load testing."
 
@@ -55,7 +104,14 @@ class Command(BaseCommand):
         Event.objects.all().delete()
 
     def add_arguments(self, parser):
-        parser.add_argument("--events", type=int, required=True, help="Number of events to create.")
+        size = parser.add_mutually_exclusive_group(required=True)
+        size.add_argument("--events", type=int, help="Number of events to create.")
+        size.add_argument(
+            "--events-total",
+            type=int,
+            help="With --append: create however many events bring the table to this total "
+            "(resetting first if it already holds more).",
+        )
         parser.add_argument(
             "--hot-user-id",
             type=int,
@@ -79,24 +135,56 @@ class Command(BaseCommand):
             action="store_true",
             help="Delete existing activity tables before seeding.",
         )
+        parser.add_argument(
+            "--append",
+            action="store_true",
+            help="Add --events more events to the existing ones (object ids continue after them).",
+        )
 
     def handle(self, *args, **opts):
-        total_events: int = int(opts["events"])
+        events_total: int | None = opts["events_total"]
+        total_events: int = int(opts["events"] if events_total is None else events_total)
         hot_user_id: int = int(opts["hot_user_id"])
         actor_id: int = int(opts["actor_id"])
         batch_size: int = int(opts["batch_size"])
         reset: bool = bool(opts["reset"])
+        append: bool = bool(opts["append"])
 
         if total_events <= 0:
             self.stderr.write("events must be > 0")
             return
+        if reset and append:
+            self.stderr.write("--reset and --append are mutually exclusive")
+            return
+        if events_total is not None and not append:
+            self.stderr.write("--events-total requires --append")
+            return
 
         if reset:
             # Order matters due to FK constraints.
             self._reset_tables()
 
+        existing = Event.objects.count() if append else 0
+        if events_total is not None:
+            if existing > events_total:
+                # Appending can't shrink the table (e.g. rows POSTed by a load test run).
+                self.stdout.write(f"Table already holds {existing:,} events (> {events_total:,}); resetting.")
+                self._reset_tables()
+                existing = 0
+            total_events = events_total - existing
+            if total_events == 0:
+                self.stdout.write(self.style.SUCCESS(f"Done. Table already holds {events_total:,} events."))
+                return
+
         verbs = ["like", "comment", "follow", "purchase", "share"]
+        choices = random.choices
         now = timezone.now()
+        # Adapt the shared timestamp to its DB form once, not once per row: a literal
+        # for the COPY stream, the backend's bound form elsewhere.
+        if _can_copy():
+            db_now = now.isoformat(sep=" ")
+        else:
+            db_now = connection.ops.adapt_datetimefield_value(now)
 
         self.stdout.write(
             f"Seeding {total_events:,} events (hot_user_id={hot_user_id}) in batches of {batch_size:,}..."
@@ -104,31 +192,34 @@ class Command(BaseCommand):
         start = time.time()
 
         created = 0
-        object_id_counter = 1
+        object_id_counter = existing + 1
         while created < total_events:
             n = min(batch_size, total_events - created)
-            batch_events = [
-                Event(
-                    actor_id=actor_id,
-                    verb=random.choice(verbs),
-                    object_type="post",
-                    object_id=str(object_id_counter + i),
-                    created_at=now,
+            # One C-level call each for verbs and ids instead of per-row Python calls.
+            batch_verbs = choices(verbs, k=n)
+            batch_object_ids = map(str, range(object_id_counter, object_id_counter + n))
+            rows = list(
+                zip(
+                    repeat(actor_id),
+                    batch_verbs,
+                    repeat("post"),
+                    batch_object_ids,
+                    repeat(db_now),
                 )
-                for i in range(n)
-            ]
-
-            with transaction.atomic():
-                Event.objects.bulk_create(batch_events, batch_size=min(5000, n))
-
-                feed_items = [
-                    FeedItem(user_id=hot_user_id, event=e, created_at=now) for e in batch_events
-                ]
-                notifications = [
-                    Notification(user_id=hot_user_id, event=e, created_at=now) for e in batch_events
-                ]
-                FeedItem.objects.bulk_create(feed_items, batch_size=min(5000, n), ignore_conflicts=True)
-                Notification.objects.bulk_create(notifications, batch_size=min(5000, n), ignore_conflicts=True)
+            )
+
+            with transaction.atomic(), connection.cursor() as cur:
+                cur.execute(f"SELECT COALESCE(MAX(id), 0) FROM {_table(Event)}")
+                (prev_max_id,) = cur.fetchone()
+                _bulk_copy_events(cur, rows)
+                # Fan out server-side from the rows just written: no ids come back to Python.
+                for model in (FeedItem, Notification):
+                    cur.execute(
+                        f"INSERT INTO {_table(model)} (user_id, event_id, created_at) "
+                        f"SELECT %s, id, created_at FROM {_table(Event)} WHERE id > %s "
+                        "ON CONFLICT DO NOTHING",
+                        [hot_user_id, prev_max_id],
+                    )
 
             created += n
             object_id_counter += n
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+
+def _get_header_user_id(request) -> int | None:
+    """
+    Mock auth: read user id from the X-User-Id header (any casing).
+
+    META keys are already normalized by Django, so X-User-Id / X-User-ID / X-USER-ID
+    are one lookup. A bare `user_id` header is still tolerated for older clients.
+    """
+
+    meta = request.META
+    raw = meta.get("HTTP_X_USER_ID") or meta.get("HTTP_USER_ID")
+    if raw is None:
+        return None
+    try:
+        value = int(raw)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+class UserIdMiddleware:
+    """
+    Parse the mock-auth header once per request into `request.user_id` (int or None).
+
+    Both sync and async capable, so the SSE view isn't pushed through a thread adapter.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.user_id = _get_header_user_id(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.user_id = _get_header_user_id(request)
+        return await self.get_response(request)
@@ -1,7 +1,16 @@
 from __future__ import annotations
 
+import re
+from datetime import datetime
+from typing import Annotated, Any
+
 from rest_framework import serializers
 
+try:
+    import msgspec  # type: ignore
+except ImportError:  # pragma: no cover
+    msgspec = None
+
 
 class EventIngestSerializer(serializers.Serializer):
     actor_id = serializers.IntegerField(min_value=1)
@@ -15,12 +24,70 @@ class EventIngestSerializer(serializers.Serializer):
     created_at = serializers.DateTimeField(required=False)
 
 
+if msgspec is not None:
+    _PositiveInt = Annotated[int, msgspec.Meta(ge=1)]
+
+    class _EventIngestStruct(msgspec.Struct):
+        actor_id: _PositiveInt
+        verb: Annotated[str, msgspec.Meta(min_length=1, max_length=64)]
+        object_type: Annotated[str, msgspec.Meta(min_length=1, max_length=64)]
+        object_id: Annotated[str, msgspec.Meta(min_length=1, max_length=128)]
+        target_user_ids: list[_PositiveInt]
+
+    _ingest_decoder = msgspec.json.Decoder(_EventIngestStruct)
+
+# CharField's ProhibitNullCharactersValidator / ProhibitSurrogateCharactersValidator.
+_DRF_REJECTED_CHARS = re.compile("[\x00\ud800-\udfff]")
+
+
+def fast_validate_event_ingest(body: bytes) -> dict[str, Any] | None:
+    """
+    Validate a JSON ingest body with msgspec, returning the same dict as
+    EventIngestSerializer.validated_data.
+
+    Only the common, unambiguous case is handled here. Returns None when msgspec isn't
+    installed or the body needs DRF's semantics (errors, whitespace trimming, type
+    coercion, created_at parsing, null/surrogate characters), and the caller then runs
+    the serializer as before.
+    """
+
+    if msgspec is None or b'"created_at"' in body:
+        return None
+    try:
+        ev = _ingest_decoder.decode(body)
+    except msgspec.MsgspecError:
+        return None
+    for value in (ev.verb, ev.object_type, ev.object_id):
+        if value != value.strip() or _DRF_REJECTED_CHARS.search(value):
+            return None
+    return {
+        "actor_id": ev.actor_id,
+        "verb": ev.verb,
+        "object_type": ev.object_type,
+        "object_id": ev.object_id,
+        "target_user_ids": ev.target_user_ids,
+    }
+
+
 class FeedQuerySerializer(serializers.Serializer):
     user_id = serializers.IntegerField(min_value=1, required=False)
     cursor = serializers.CharField(required=False, allow_blank=True)
     limit = serializers.IntegerField(min_value=1, max_value=200, required=False)
 
 
+def _iso(dt: datetime | None) -> str | None:
+    """
+    ISO 8601 the way DRF's DateTimeField renders it (UTC as a trailing "Z").
+    """
+
+    if dt is None:
+        return None
+    value = dt.isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
 class EventOutSerializer(serializers.Serializer):
     event_id = serializers.IntegerField(source="id")
     actor_id = serializers.IntegerField()
@@ -45,3 +112,50 @@ class NotificationOutSerializer(serializers.Serializer):
 
     event = EventOutSerializer()
 
+
+# `.values()` row builders.
+#
+# The list endpoints skip model instantiation entirely: they select exactly these
+# columns (event columns through the FK join) and rename them into the payload shape.
+# EventOutSerializer / NotificationOutSerializer above document that shape; the tests
+# check these builders against them.
+
+EVENT_ROW_FIELDS = (
+    "event_id",
+    "event__actor_id",
+    "event__verb",
+    "event__object_type",
+    "event__object_id",
+    "event__created_at",
+)
+
+NOTIFICATION_ROW_FIELDS = (
+    "id",
+    "user_id",
+    "created_at",
+    "read_at",
+    "delivered_at",
+    *EVENT_ROW_FIELDS,
+)
+
+
+def serialize_event_row(r: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "event_id": r["event_id"],
+        "actor_id": r["event__actor_id"],
+        "verb": r["event__verb"],
+        "object_type": r["event__object_type"],
+        "object_id": r["event__object_id"],
+        "created_at": _iso(r["event__created_at"]),
+    }
+
+
+def serialize_notification_row(r: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "notification_id": r["id"],
+        "user_id": r["user_id"],
+        "created_at": _iso(r["created_at"]),
+        "read_at": _iso(r["read_at"]),
+        "delivered_at": _iso(r["delivered_at"]),
+        "event": serialize_event_row(r),
+    }
@@ -1,32 +1,93 @@
 from __future__ import annotations
 
 import asyncio
+import concurrent.futures
 import json
-from collections import defaultdict
+import logging
+import threading
+from collections import deque
 from dataclasses import dataclass
-from typing import Any, DefaultDict
+from typing import Any, Coroutine
 
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None
 
-def format_sse(*, data: Any, event: str = "notification", event_id: int | None = None) -> str:
+logger = logging.getLogger(__name__)
+
+
+def _dumps(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def format_sse(*, data: Any, event: str = "notification", event_id: int | None = None) -> bytes:
     """
-    Format a Server-Sent Event message.
+    Format a Server-Sent Event message as UTF-8 bytes, ready to write to the stream.
     """
 
-    payload = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
-    lines: list[str] = []
+    lines: list[bytes] = []
     if event_id is not None:
-        lines.append(f"id: {event_id}")
+        lines.append(b"id: %d" % event_id)
     if event:
-        lines.append(f"event: {event}")
+        lines.append(b"event: " + event.encode("utf-8"))
     # SSE supports multi-line data; we avoid newlines by using compact JSON.
-    lines.append(f"data: {payload}")
-    return "\n".join(lines) + "\n\n"
+    lines.append(b"data: " + _dumps(data))
+    return b"\n".join(lines) + b"\n\n"
+
+
+KEEPALIVE_FRAME = b": keep-alive\n\n"
+KEEPALIVE_INTERVAL = 15.0
 
 
 @dataclass(frozen=True)
 class Subscriber:
+    """
+    One SSE connection: a bounded ring of pending, already-formatted SSE frames
+    plus a wakeup flag owned by the loop serving the connection.
+
+    push() may be called from any thread (the broker publishes on its own loop);
+    drain() only from the serving loop.
+    """
+
     user_id: int
-    queue: "asyncio.Queue[dict[str, Any]]"
+    buffer: "deque[bytes]"
+    ready: asyncio.Event
+    loop: asyncio.AbstractEventLoop
+
+    def push(self, frame: bytes) -> bool:
+        """
+        Queue a frame and wake the reader. Returns False if the serving loop is gone,
+        i.e. the connection is dead and should be unsubscribed.
+        """
+
+        # Backpressure strategy: deque(maxlen) drops the oldest frame when the
+        # client is too slow (polling can catch up).
+        self.buffer.append(frame)
+        # asyncio.Event isn't thread-safe; wake the reader on its own loop. The loop
+        # may close at any moment, so try the call rather than checking first.
+        try:
+            self.loop.call_soon_threadsafe(self.ready.set)
+        except RuntimeError:
+            return False
+        return True
+
+    def drain(self) -> list[bytes]:
+        # Clear first: a concurrent push then re-sets the flag after us. popleft()
+        # (rather than list() + clear()) can't lose a frame appended in between.
+        self.ready.clear()
+        buffer = self.buffer
+        return [buffer.popleft() for _ in range(len(buffer))]
+
+
+def _log_failure(future: concurrent.futures.Future) -> None:
+    if future.cancelled():
+        return
+    exc = future.exception()
+    if exc is not None:
+        logger.error("SSE publish failed", exc_info=exc)
 
 
 class NotificationBroker:
@@ -39,46 +100,126 @@ class NotificationBroker:
     """
 
     def __init__(self) -> None:
-        self._lock = asyncio.Lock()
-        self._subs: DefaultDict[int, set[asyncio.Queue[dict[str, Any]]]] = defaultdict(set)
+        # Writers (subscribe/unsubscribe, and publishers dropping dead connections)
+        # serialize on the lock and replace the per-user tuple wholesale; readers
+        # (publish_many/active_subscribers) only do a single dict lookup, so they never
+        # take the lock. Writers run on different loops/threads, hence a threading
+        # lock; it is never held across an await.
+        self._lock = threading.Lock()
+        self._subs: dict[int, tuple[Subscriber, ...]] = {}
+        # Dedicated publisher loop, started on first use (see submit()). It also runs
+        # the single keep-alive ticker shared by every stream.
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self._loop_lock = threading.Lock()
+        self._keepalive: concurrent.futures.Future | None = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        loop = self.loop
+        if loop is not None:
+            return loop
+        with self._loop_lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="sse-broker", daemon=True).start()
+                self.loop = loop
+            return self.loop
+
+    def submit(self, coro: Coroutine[Any, Any, Any]) -> concurrent.futures.Future:
+        """
+        Run a publish coroutine on the broker's own loop thread and return at once.
+
+        Callable from any thread (e.g. a sync view's on_commit hook), so the request
+        never waits for the fan-out. Nobody awaits the returned future, so a failure
+        is logged here rather than dropped.
+        """
+
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        future.add_done_callback(_log_failure)
+        return future
+
+    async def _keepalive_loop(self) -> None:
+        while True:
+            await asyncio.sleep(KEEPALIVE_INTERVAL)
+            for subs in list(self._subs.values()):
+                for sub in subs:
+                    # Idle connections only; a pending frame already keeps it alive.
+                    if not sub.buffer and not sub.push(KEEPALIVE_FRAME):
+                        self._remove(sub)
+
+    def _ensure_keepalive(self) -> None:
+        if self._keepalive is not None:
+            return
+        loop = self._ensure_loop()
+        with self._loop_lock:
+            if self._keepalive is not None:
+                return
+            future = asyncio.run_coroutine_threadsafe(self._keepalive_loop(), loop)
+            self._keepalive = future
+        # Outside the lock: a callback added to an already-finished future runs inline.
+        future.add_done_callback(_log_failure)
+        future.add_done_callback(self._keepalive_done)
+
+    def _keepalive_done(self, future: concurrent.futures.Future) -> None:
+        # The ticker only ends by failing; let the next subscribe() start a new one.
+        with self._loop_lock:
+            if self._keepalive is future:
+                self._keepalive = None
 
     async def subscribe(self, user_id: int, *, max_queue_size: int = 200) -> Subscriber:
-        q: asyncio.Queue[dict[str, Any]] = asyncio.Queue(maxsize=max_queue_size)
-        async with self._lock:
-            self._subs[user_id].add(q)
-        return Subscriber(user_id=user_id, queue=q)
+        sub = Subscriber(
+            user_id=user_id,
+            buffer=deque(maxlen=max_queue_size),
+            ready=asyncio.Event(),
+            loop=asyncio.get_running_loop(),
+        )
+        self._ensure_keepalive()
+        with self._lock:
+            self._subs[user_id] = self._subs.get(user_id, ()) + (sub,)
+        return sub
 
     async def unsubscribe(self, sub: Subscriber) -> None:
-        async with self._lock:
-            queues = self._subs.get(sub.user_id)
-            if not queues:
+        self._remove(sub)
+
+    def _remove(self, sub: Subscriber) -> None:
+        with self._lock:
+            subs = self._subs.get(sub.user_id)
+            if not subs:
                 return
-            queues.discard(sub.queue)
-            if not queues:
+            remaining = tuple(s for s in subs if s is not sub)
+            if remaining:
+                self._subs[sub.user_id] = remaining
+            else:
                 self._subs.pop(sub.user_id, None)
 
     async def publish(self, user_id: int, message: dict[str, Any]) -> None:
-        async with self._lock:
-            queues = list(self._subs.get(user_id, ()))
-        if not queues:
-            return
+        await self.publish_many({user_id: message})
 
-        for q in queues:
-            # Backpressure strategy: if a client is too slow, drop the oldest.
-            if q.full():
-                try:
-                    q.get_nowait()
-                except asyncio.QueueEmpty:
-                    pass
-            try:
-                q.put_nowait(message)
-            except asyncio.QueueFull:
-                # If still full, drop this message (polling can catch up).
-                continue
+    async def publish_many(self, messages: dict[int, dict[str, Any]]) -> None:
+        """
+        Publish one message per user (user_id -> message) in a single call.
+        """
 
-    async def any_subscribers(self, user_ids: list[int]) -> bool:
-        async with self._lock:
-            return any(bool(self._subs.get(uid)) for uid in user_ids)
+        subs_by_user = self._subs
+        for user_id, message in messages.items():
+            subs = subs_by_user.get(user_id)
+            if not subs:
+                continue
+            frame = format_sse(data=message, event_id=int(message.get("notification_id") or 0))
+            self._push_all(subs, frame)
+
+    def _push_all(self, subs: tuple[Subscriber, ...], frame: bytes) -> None:
+        # A connection whose loop has closed is dropped; delivery to the rest goes on.
+        for sub in subs:
+            if not sub.push(frame):
+                self._remove(sub)
+
+    async def active_subscribers(self, user_ids: list[int]) -> list[int]:
+        """
+        The subset of `user_ids` with at least one open stream right now.
+        """
+
+        subs = self._subs
+        return [uid for uid in user_ids if uid in subs]
 
 
 broker = NotificationBroker()
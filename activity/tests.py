@@ -1,12 +1,189 @@
 from __future__ import annotations
 
-from django.test import TestCase
+import unittest
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
 from django.utils import timezone
 from rest_framework.test import APIClient
 
 from .models import Event, FeedItem
 
 
+class EventIngestTests(TestCase):
+    def test_ingest_fans_out_and_replays_idempotently(self):
+        from .models import Notification
+
+        client = APIClient()
+        client.credentials(HTTP_X_USER_ID="1", HTTP_IDEMPOTENCY_KEY="k-1")
+        body = {
+            "actor_id": 1,
+            "verb": "like",
+            "object_type": "post",
+            "object_id": "42",
+            "target_user_ids": [3, 2, 3],
+        }
+
+        r1 = client.post("/api/events", body, format="json")
+        self.assertEqual(r1.status_code, 201)
+        event_id = r1.data["event_id"]
+        self.assertEqual(
+            sorted(FeedItem.objects.filter(event_id=event_id).values_list("user_id", flat=True)),
+            [2, 3],
+        )
+        self.assertEqual(Notification.objects.filter(event_id=event_id).count(), 2)
+
+        r2 = client.post("/api/events", body, format="json")
+        self.assertEqual(r2.status_code, 200)
+        self.assertEqual(r2.data["event_id"], event_id)
+        self.assertEqual(Event.objects.count(), 1)
+
+    def test_fast_ingest_validation_matches_serializer(self):
+        import json
+
+        from .serializers import (
+            EventIngestSerializer,
+            fast_validate_event_ingest,
+            msgspec,
+        )
+
+        if msgspec is None:
+            raise unittest.SkipTest("msgspec not installed")
+
+        body = {
+            "actor_id": 1,
+            "verb": "like",
+            "object_type": "post",
+            "object_id": "7",
+            "target_user_ids": [3, 2, 3],
+        }
+        serializer = EventIngestSerializer(data=body)
+        self.assertTrue(serializer.is_valid())
+        self.assertEqual(fast_validate_event_ingest(json.dumps(body).encode()), dict(serializer.validated_data))
+        # Anything needing DRF's coercion or error reporting falls back.
+        self.assertIsNone(fast_validate_event_ingest(json.dumps({**body, "object_id": 7}).encode()))
+        self.assertIsNone(fast_validate_event_ingest(json.dumps({**body, "verb": " like "}).encode()))
+        self.assertIsNone(fast_validate_event_ingest(json.dumps({**body, "actor_id": 0}).encode()))
+        # CharField rejects these (400); they must not slip through to the insert.
+        for bad in ("li\x00ke", "li\ud800ke"):
+            self.assertFalse(EventIngestSerializer(data={**body, "verb": bad}).is_valid())
+            self.assertIsNone(fast_validate_event_ingest(json.dumps({**body, "verb": bad}).encode()))
+
+    def test_fast_ingest_accepts_charset_content_type(self):
+        import json
+        from unittest import mock
+
+        from . import views
+
+        client = APIClient()
+        client.credentials(HTTP_X_USER_ID="1")
+        body = {"actor_id": 1, "verb": "like", "object_type": "post", "object_id": "8", "target_user_ids": [2]}
+        with mock.patch.object(views, "fast_validate_event_ingest", wraps=views.fast_validate_event_ingest) as fast:
+            r = client.post("/api/events", json.dumps(body), content_type="application/json; charset=utf-8")
+        self.assertEqual(r.status_code, 201)
+        fast.assert_called_once()
+        self.assertEqual(Event.objects.get(id=r.data["event_id"]).object_id, "8")
+
+    def test_ingest_publishes_to_live_subscribers(self):
+        import asyncio
+        import json
+        import threading
+
+        from .models import Notification
+        from .sse import broker
+
+        # Serve the stream from a loop that stays open, as a live connection would.
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+
+        async def _next_frames() -> list[bytes]:
+            await sub.ready.wait()
+            return sub.drain()
+
+        sub = asyncio.run_coroutine_threadsafe(broker.subscribe(2), loop).result(timeout=5)
+        try:
+            client = APIClient()
+            client.credentials(HTTP_X_USER_ID="1")
+            body = {
+                "actor_id": 1,
+                "verb": "comment",
+                "object_type": "post",
+                "object_id": "7",
+                "target_user_ids": [2, 3],
+            }
+            with self.captureOnCommitCallbacks(execute=True):
+                r = client.post("/api/events", body, format="json")
+            self.assertEqual(r.status_code, 201)
+
+            # Publishing happens on the broker's loop thread; the reader wakes on its own.
+            frames = asyncio.run_coroutine_threadsafe(_next_frames(), loop).result(timeout=5)
+            self.assertEqual(len(frames), 1)
+            payload = json.loads(frames[0].split(b"data: ", 1)[1])
+            n = Notification.objects.get(user_id=2, event_id=r.data["event_id"])
+            self.assertEqual(payload["notification_id"], n.id)
+            self.assertEqual(payload["event"]["object_id"], "7")
+            # Delivered, not dropped as a dead connection.
+            self.assertIn(sub, broker._subs.get(2, ()))
+        finally:
+            asyncio.run_coroutine_threadsafe(broker.unsubscribe(sub), loop).result(timeout=5)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout=5)
+            loop.close()
+
+
+class PublishFallbackTests(TransactionTestCase):
+    # Committed rows: the lookup runs on another thread with its own connection.
+
+    def test_publish_without_returning_looks_up_rows_and_recycles_connection(self):
+        import asyncio
+        import json
+        import threading
+        from unittest import mock
+
+        from . import views
+        from .models import Notification
+        from .sse import broker
+
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+
+        async def _next_frames() -> list[bytes]:
+            await sub.ready.wait()
+            return sub.drain()
+
+        real_fanout = views._fanout_event
+
+        def _fanout_without_ids(**kwargs):
+            # Behave like a backend that can't report the inserted ids.
+            real_fanout(**kwargs)
+            return None
+
+        sub = asyncio.run_coroutine_threadsafe(broker.subscribe(2), loop).result(timeout=5)
+        try:
+            client = APIClient()
+            client.credentials(HTTP_X_USER_ID="1")
+            body = {"actor_id": 1, "verb": "like", "object_type": "post", "object_id": "5", "target_user_ids": [2]}
+            with (
+                mock.patch.object(views, "_fanout_event", _fanout_without_ids),
+                mock.patch.object(views, "close_old_connections", wraps=views.close_old_connections) as close,
+            ):
+                r = client.post("/api/events", body, format="json")
+                self.assertEqual(r.status_code, 201)
+                frames = asyncio.run_coroutine_threadsafe(_next_frames(), loop).result(timeout=5)
+
+            payload = json.loads(frames[0].split(b"data: ", 1)[1])
+            n = Notification.objects.get(user_id=2, event_id=r.data["event_id"])
+            self.assertEqual(payload["notification_id"], n.id)
+            self.assertEqual(close.call_count, 2)
+        finally:
+            asyncio.run_coroutine_threadsafe(broker.unsubscribe(sub), loop).result(timeout=5)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout=5)
+            loop.close()
+
+
 class FeedTests(TestCase):
     def test_feed_paginates_with_stable_cursor(self):
         now = timezone.now()
@@ -29,13 +206,39 @@ class FeedTests(TestCase):
 
         r1 = client.get("/api/feed", {"limit": 2, "user_id": 2})
         self.assertEqual(r1.status_code, 200)
-        self.assertEqual(len(r1.data["items"]), 2)
-        self.assertIsNotNone(r1.data["next_cursor"])
+        p1 = r1.json()
+        self.assertEqual(len(p1["items"]), 2)
+        self.assertIsNotNone(p1["next_cursor"])
 
-        r2 = client.get("/api/feed", {"limit": 2, "user_id": 2, "cursor": r1.data["next_cursor"]})
+        r2 = client.get("/api/feed", {"limit": 2, "user_id": 2, "cursor": p1["next_cursor"]})
         self.assertEqual(r2.status_code, 200)
-        self.assertEqual(len(r2.data["items"]), 2)
-        self.assertNotEqual(r1.data["items"][0]["event_id"], r2.data["items"][0]["event_id"])
+        p2 = r2.json()
+        self.assertEqual(len(p2["items"]), 2)
+        self.assertNotEqual(p1["items"][0]["event_id"], p2["items"][0]["event_id"])
+
+        # An exactly-full last page must not hand out a cursor to an empty page.
+        full = client.get("/api/feed", {"limit": 5, "user_id": 2}).json()
+        self.assertEqual(len(full["items"]), 5)
+        self.assertIsNone(full["next_cursor"])
+
+
+class CursorTests(TestCase):
+    def test_cursor_round_trips_exact_microseconds(self):
+        from .cursors import decode_feed_cursor, encode_feed_cursor
+
+        created_at = timezone.now().replace(microsecond=999_999)
+        token = encode_feed_cursor(created_at, 42)
+        self.assertEqual(len(token), 22)
+
+        cursor = decode_feed_cursor(token)
+        self.assertEqual(cursor.created_at, created_at)
+        self.assertEqual(cursor.feed_item_id, 42)
+
+    def test_invalid_cursor_is_rejected(self):
+        from .cursors import decode_feed_cursor
+
+        self.assertIsNone(decode_feed_cursor("not-a-cursor!"))
+        self.assertIsNone(decode_feed_cursor("AAAA"))
 
 
 class NotificationsTests(TestCase):
@@ -65,8 +268,31 @@ class NotificationsTests(TestCase):
 
         r = client.get("/api/notifications", {"user_id": 2, "since": n1.id})
         self.assertEqual(r.status_code, 200)
-        self.assertEqual(len(r.data["items"]), 1)
-        self.assertEqual(r.data["items"][0]["event"]["object_id"], "2")
+        items = r.json()["items"]
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0]["event"]["object_id"], "2")
+
+    def test_row_builder_matches_drf_serializer(self):
+        from .models import Notification
+        from .serializers import (
+            NOTIFICATION_ROW_FIELDS,
+            NotificationOutSerializer,
+            serialize_notification_row,
+        )
+
+        ev = Event.objects.create(
+            actor_id=1,
+            verb="like",
+            object_type="post",
+            object_id="1",
+            created_at=timezone.now(),
+        )
+        n = Notification.objects.create(user_id=2, event=ev, created_at=timezone.now())
+
+        expected = NotificationOutSerializer(n).data
+        expected = {**expected, "event": dict(expected["event"])}
+        row = Notification.objects.filter(id=n.id).values(*NOTIFICATION_ROW_FIELDS).get()
+        self.assertEqual(serialize_notification_row(row), expected)
 
 
 class AnalyticsTests(TestCase):
@@ -81,3 +307,178 @@ class AnalyticsTests(TestCase):
         top = sw.top(now_ts=110.0)
         self.assertEqual(top[0], ("a", 2))
         self.assertEqual(top[1], ("b", 1))
+
+    def test_expired_keys_drop_out_of_top(self):
+        from .analytics import SlidingWindowTop
+
+        sw = SlidingWindowTop(window_seconds=10, bucket_size_seconds=5)
+        sw.add("old", ts=100.0)
+        sw.add("new", ts=121.0)
+
+        self.assertEqual(sw.top(now_ts=121.0), [("new", 1)])
+
+    def test_cached_top_sees_keys_crossing_the_threshold(self):
+        from .analytics import SlidingWindowTop
+
+        sw = SlidingWindowTop(window_seconds=60, bucket_size_seconds=5)
+        for key in ("a", "a", "b", "c"):
+            sw.add(key, ts=100.0)
+        self.assertEqual(sw.top(k=2, now_ts=100.0)[0], ("a", 2))
+
+        sw.add("c", ts=100.0)
+        sw.add("c", ts=100.0)
+        self.assertEqual(sw.top(k=2, now_ts=100.0), [("c", 3), ("a", 2)])
+
+    def test_top_with_non_positive_k_is_empty(self):
+        from .analytics import SlidingWindowTop
+
+        sw = SlidingWindowTop(window_seconds=60, bucket_size_seconds=5)
+        sw.add("a", ts=100.0)
+
+        self.assertEqual(sw.top(k=0, now_ts=100.0), [])
+        self.assertEqual(sw.top(k=-1, now_ts=100.0), [])
+        self.assertEqual(sw.top(k=1, now_ts=100.0), [("a", 1)])
+
+
+class SseTests(TestCase):
+    def test_format_sse_emits_compact_utf8_bytes(self):
+        from .sse import format_sse
+
+        frame = format_sse(data={"verb": "café", "n": 1}, event_id=7)
+        self.assertEqual(frame, 'id: 7\nevent: notification\ndata: {"verb":"café","n":1}\n\n'.encode())
+
+    def test_failed_publish_is_logged(self):
+        import time
+
+        from .sse import broker
+
+        async def _fail() -> None:
+            raise RuntimeError("publish boom")
+
+        with self.assertLogs("activity.sse", level="ERROR") as logs:
+            broker.submit(_fail())
+            # The done-callback runs on the broker thread.
+            deadline = time.monotonic() + 5
+            while not logs.records and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertIn("publish boom", logs.output[0])
+
+    def test_dead_subscriber_is_dropped_without_aborting_fanout(self):
+        import asyncio
+
+        from .sse import NotificationBroker
+
+        broker = NotificationBroker()
+        # asyncio.run() closes its loop on return, so this connection's loop is gone.
+        asyncio.run(broker.subscribe(2))
+        loop = asyncio.new_event_loop()
+        try:
+            live = loop.run_until_complete(broker.subscribe(3))
+            asyncio.run(broker.publish_many({2: {"notification_id": 1}, 3: {"notification_id": 2}}))
+            self.assertEqual(len(live.buffer), 1)
+            self.assertEqual(asyncio.run(broker.active_subscribers([2, 3])), [3])
+        finally:
+            loop.close()
+
+
+    def test_failed_keepalive_ticker_is_logged_and_restarted(self):
+        import asyncio
+        import time
+        from collections import deque
+        from types import SimpleNamespace
+        from unittest import mock
+
+        from . import sse
+
+        def _boom(frame: bytes) -> bool:
+            raise ValueError("keepalive boom")
+
+        broker = sse.NotificationBroker()
+        with mock.patch.object(sse, "KEEPALIVE_INTERVAL", 0.01):
+            with self.assertLogs("activity.sse", level="ERROR") as logs:
+                broker._subs[9] = (SimpleNamespace(user_id=9, buffer=deque(), push=_boom),)
+                broker._ensure_keepalive()
+                deadline = time.monotonic() + 5
+                while broker._keepalive is not None and time.monotonic() < deadline:
+                    time.sleep(0.01)
+            self.assertIsNone(broker._keepalive)
+            self.assertIn("keepalive boom", logs.output[0])
+
+            broker._subs.clear()
+            sub = asyncio.run(broker.subscribe(2))
+            self.assertIsNotNone(broker._keepalive)
+            self.assertFalse(broker._keepalive.done())
+            asyncio.run(broker.unsubscribe(sub))
+
+@unittest.skipUnless(connection.vendor == "postgresql", "PostgreSQL-only write paths")
+class PostgresWriteTests(TestCase):
+    def test_fanout_cte_returns_only_new_notifications(self):
+        from .models import Notification
+        from .views import _fanout_event
+
+        now = timezone.now()
+        ev = Event.objects.create(actor_id=1, verb="like", object_type="post", object_id="1", created_at=now)
+        # Pre-existing rows on different users, so each ON CONFLICT skips independently.
+        FeedItem.objects.create(user_id=2, event=ev, created_at=now)
+        existing = Notification.objects.create(user_id=3, event=ev, created_at=now)
+
+        rows = _fanout_event(event_id=ev.id, created_at=now, user_ids=[2, 3, 4])
+
+        self.assertEqual(
+            sorted(FeedItem.objects.filter(event=ev).values_list("user_id", flat=True)),
+            [2, 3, 4],
+        )
+        notifs = dict(Notification.objects.filter(event=ev).values_list("user_id", "id"))
+        self.assertEqual(sorted(notifs), [2, 3, 4])
+        self.assertEqual(notifs[3], existing.id)
+        self.assertEqual(sorted(rows), sorted((notifs[uid], uid) for uid in (2, 4)))
+        self.assertEqual(FeedItem.objects.get(event=ev, user_id=4).created_at, now)
+
+    def test_idempotency_upsert_replays_the_original_event(self):
+        from .models import IdempotencyKey
+        from .views import _claim_idempotency_key
+
+        idem_id, event_id = _claim_idempotency_key("pg-k-1")
+        self.assertIsNone(event_id)
+        # A second claim before the event is written hits the same row.
+        self.assertEqual(_claim_idempotency_key("pg-k-1"), (idem_id, None))
+
+        client = APIClient()
+        client.credentials(HTTP_X_USER_ID="1", HTTP_IDEMPOTENCY_KEY="pg-k-2")
+        body = {"actor_id": 1, "verb": "like", "object_type": "post", "object_id": "9", "target_user_ids": [2]}
+        r1 = client.post("/api/events", body, format="json")
+        self.assertEqual(r1.status_code, 201)
+        r2 = client.post("/api/events", body, format="json")
+        self.assertEqual(r2.status_code, 200)
+        self.assertEqual(r2.data["event_id"], r1.data["event_id"])
+        self.assertEqual(Event.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.get(key="pg-k-2").event_id, r1.data["event_id"])
+
+    def test_seed_events_writes_rows_and_timestamps(self):
+        from io import StringIO
+
+        from django.core.management import call_command
+
+        from .management.commands.seed_events import _bulk_copy_events, _can_copy
+        from .models import Notification
+
+        before = timezone.now()
+        call_command("seed_events", events=25, batch_size=10, hot_user_id=5, stdout=StringIO())
+        after = timezone.now()
+
+        self.assertEqual(Event.objects.count(), 25)
+        self.assertEqual(FeedItem.objects.filter(user_id=5).count(), 25)
+        self.assertEqual(Notification.objects.filter(user_id=5).count(), 25)
+        self.assertEqual(
+            sorted(Event.objects.values_list("object_id", flat=True)),
+            sorted(str(i) for i in range(1, 26)),
+        )
+        (created_at,) = set(Event.objects.values_list("created_at", flat=True))
+        self.assertTrue(before <= created_at <= after)
+
+        # Values that need escaping in COPY's text format round-trip unchanged.
+        db_now = before.isoformat(sep=" ") if _can_copy() else before
+        with connection.cursor() as cur:
+            _bulk_copy_events(cur, [(1, "li\tke", "po\\st", "a\nb", db_now)])
+        ev = Event.objects.get(verb="li\tke")
+        self.assertEqual((ev.object_type, ev.object_id, ev.created_at), ("po\\st", "a\nb", before))
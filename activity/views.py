@@ -2,47 +2,169 @@ from __future__ import annotations
 
 import asyncio
 import json
+from datetime import UTC
 
-from django.db import IntegrityError, transaction
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, close_old_connections, connection, transaction
 from django.db.models import Q
-from django.http import StreamingHttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
 from django.utils.decorators import classonlymethod
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from .analytics import analytics
 from .cursors import decode_feed_cursor, encode_feed_cursor
 from .models import Event, FeedItem, IdempotencyKey, Notification
 from .serializers import (
+    EVENT_ROW_FIELDS,
+    NOTIFICATION_ROW_FIELDS,
     EventIngestSerializer,
-    EventOutSerializer,
     FeedQuerySerializer,
-    NotificationOutSerializer,
     NotificationsQuerySerializer,
+    fast_validate_event_ingest,
+    serialize_event_row,
+    serialize_notification_row,
 )
-from .analytics import analytics
 from .sse import broker, format_sse
 
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None
 
-def _get_header_user_id(request) -> int | None:
+
+def _json_response(payload: dict) -> HttpResponse:
     """
-    Mock auth: read user id from header. We accept common header names.
+    200 JSON response for already-plain payloads, skipping DRF's renderer and
+    content negotiation.
     """
 
-    raw = (
-        request.headers.get("X-User-Id")
-        or request.headers.get("X-User-ID")
-        or request.headers.get("X-USER-ID")
-        or request.headers.get("user_id")
+    if orjson is not None:
+        body = orjson.dumps(payload)
+    else:
+        body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return HttpResponse(body, content_type="application/json")
+
+
+def _fanout_insert(
+    model,
+    *,
+    event_id: int,
+    created_at,
+    user_ids: list[int],
+    returning: bool = False,
+) -> list[tuple[int, int]] | None:
+    """
+    Insert one (user_id, event_id, created_at) row per user into a fan-out table,
+    skipping rows that already exist. No model instances are built.
+
+    Used for non-PostgreSQL backends only; PostgreSQL writes both tables in one
+    statement in _fanout_event. SQLite gets a prepared executemany(); anything else
+    falls back to bulk_create.
+
+    With returning=True, returns the inserted (id, user_id) pairs via RETURNING, or
+    None if this backend path can't report them.
+    """
+
+    table = connection.ops.quote_name(model._meta.db_table)
+    if connection.vendor == "sqlite":
+        db_created_at = connection.ops.adapt_datetimefield_value(created_at)
+        with connection.cursor() as cur:
+            if not (returning and connection.features.can_return_rows_from_bulk_insert):
+                cur.executemany(
+                    f"INSERT INTO {table} (user_id, event_id, created_at) VALUES (%s, %s, %s) "
+                    "ON CONFLICT DO NOTHING",
+                    [(uid, event_id, db_created_at) for uid in user_ids],
+                )
+                return None
+
+            # executemany() can't return rows, so use multi-row VALUES batches sized
+            # to stay under SQLite's bound-parameter limit.
+            inserted: list[tuple[int, int]] = []
+            batch = connection.ops.bulk_batch_size(["user_id", "event_id", "created_at"], user_ids)
+            for i in range(0, len(user_ids), batch):
+                chunk = user_ids[i : i + batch]
+                params: list = []
+                for uid in chunk:
+                    params += [uid, event_id, db_created_at]
+                cur.execute(
+                    f"INSERT INTO {table} (user_id, event_id, created_at) VALUES "
+                    + ", ".join(["(%s, %s, %s)"] * len(chunk))
+                    + " ON CONFLICT DO NOTHING RETURNING id, user_id",
+                    params,
+                )
+                inserted += [tuple(row) for row in cur.fetchall()]
+            return inserted
+
+    model.objects.bulk_create(
+        [model(user_id=uid, event_id=event_id, created_at=created_at) for uid in user_ids],
+        ignore_conflicts=True,
     )
-    if raw is None:
+    return None
+
+
+def _fanout_event(*, event_id: int, created_at, user_ids: list[int]) -> list[tuple[int, int]] | None:
+    """
+    Write the FeedItem and Notification fan-out rows for one event.
+
+    Returns the inserted notification (id, user_id) pairs, or None if the backend
+    couldn't report them (see _fanout_insert).
+    """
+
+    if connection.vendor != "postgresql":
+        _fanout_insert(FeedItem, event_id=event_id, created_at=created_at, user_ids=user_ids)
+        return _fanout_insert(
+            Notification,
+            event_id=event_id,
+            created_at=created_at,
+            user_ids=user_ids,
+            returning=True,
+        )
+
+    # Both inserts in one statement: a data-modifying CTE always runs to completion,
+    # even though the outer INSERT doesn't read it. One parse/plan, one round-trip.
+    feed_table = connection.ops.quote_name(FeedItem._meta.db_table)
+    notif_table = connection.ops.quote_name(Notification._meta.db_table)
+    with connection.cursor() as cur:
+        cur.execute(
+            "WITH feed AS ("
+            f"INSERT INTO {feed_table} (user_id, event_id, created_at) "
+            "SELECT uid, %s, %s FROM unnest(%s::bigint[]) AS t(uid) "
+            "ON CONFLICT DO NOTHING"
+            f") INSERT INTO {notif_table} (user_id, event_id, created_at) "
+            "SELECT uid, %s, %s FROM unnest(%s::bigint[]) AS t(uid) "
+            "ON CONFLICT DO NOTHING RETURNING id, user_id",
+            [event_id, created_at, user_ids, event_id, created_at, user_ids],
+        )
+        return [tuple(row) for row in cur.fetchall()]
+
+
+def _claim_idempotency_key(key: str) -> tuple[int, int | None] | None:
+    """
+    Insert-or-fetch an idempotency key in one statement, returning (id, event_id).
+
+    ON CONFLICT DO UPDATE (a no-op update) makes the conflicting row visible to
+    RETURNING and, on PostgreSQL, locks it like SELECT ... FOR UPDATE would. Returns
+    None on backends without upsert + RETURNING; callers fall back to the savepoint path.
+    """
+
+    if connection.vendor not in ("postgresql", "sqlite"):
         return None
-    try:
-        value = int(raw)
-    except (TypeError, ValueError):
+    if not connection.features.can_return_columns_from_insert:
         return None
-    return value if value > 0 else None
+
+    table = connection.ops.quote_name(IdempotencyKey._meta.db_table)
+    with connection.cursor() as cur:
+        cur.execute(
+            f"INSERT INTO {table} (key, created_at) VALUES (%s, %s) "
+            "ON CONFLICT (key) DO UPDATE SET key = excluded.key "
+            "RETURNING id, event_id",
+            [key, connection.ops.adapt_datetimefield_value(timezone.now())],
+        )
+        idem_id, event_id = cur.fetchone()
+    return idem_id, event_id
 
 
 class EventIngestView(APIView):
@@ -56,30 +178,43 @@ class EventIngestView(APIView):
     """
 
     def post(self, request):
-        header_user_id = _get_header_user_id(request)
+        header_user_id = request.user_id
         if header_user_id is None:
             return Response(
                 {"detail": "Missing or invalid X-User-Id header."},
                 status=status.HTTP_401_UNAUTHORIZED,
             )
 
-        serializer = EventIngestSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        data = serializer.validated_data
+        data = None
+        # Compare the bare media type: clients commonly append "; charset=utf-8".
+        if request.content_type.split(";", 1)[0].strip().lower() == "application/json":
+            data = fast_validate_event_ingest(request.body)
+        if data is None:
+            serializer = EventIngestSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            data = serializer.validated_data
 
         # Prevent spoofing in this mocked-auth setup.
-        if int(data["actor_id"]) != int(header_user_id):
+        if int(data["actor_id"]) != header_user_id:
             return Response(
                 {"detail": "actor_id must match X-User-Id header."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        target_user_ids = list(dict.fromkeys(data["target_user_ids"]))  # stable de-dupe
+        # Sorted + unique: fan-out order is irrelevant, and ascending user_ids keep the
+        # inserts into the (user_id, ...) indexes local. The serializer already yields ints.
+        target_user_ids = sorted(set(data["target_user_ids"]))
         created_at = data.get("created_at") or timezone.now()
 
         idem_key = request.headers.get("Idempotency-Key")
         with transaction.atomic():
-            if idem_key:
+            idem_id: int | None = None
+            claimed = _claim_idempotency_key(idem_key) if idem_key else None
+            if claimed is not None:
+                idem_id, prior_event_id = claimed
+                if prior_event_id is not None:
+                    return Response({"event_id": prior_event_id}, status=status.HTTP_200_OK)
+            elif idem_key:
                 # IMPORTANT: A UNIQUE violation inside the outer atomic() would
                 # mark the transaction as broken even if we catch the exception.
                 # We isolate the possible IntegrityError in a savepoint so the
@@ -93,8 +228,7 @@ class EventIngestView(APIView):
                         return Response({"event_id": existing.event_id}, status=status.HTTP_200_OK)
                     # If it's not set yet (race), continue and set it below.
                     idem = existing
-            else:
-                idem = None
+                idem_id = idem.id
 
             event = Event.objects.create(
                 actor_id=data["actor_id"],
@@ -104,25 +238,13 @@ class EventIngestView(APIView):
                 created_at=created_at,
             )
 
+            notif_rows: list[tuple[int, int]] | None = None
             if target_user_ids:
-                FeedItem.objects.bulk_create(
-                    [
-                        FeedItem(user_id=uid, event=event, created_at=created_at)
-                        for uid in target_user_ids
-                    ],
-                    ignore_conflicts=True,
-                )
-                Notification.objects.bulk_create(
-                    [
-                        Notification(user_id=uid, event=event, created_at=created_at)
-                        for uid in target_user_ids
-                    ],
-                    ignore_conflicts=True,
-                )
+                # Keep the inserted (id, user_id) pairs so the SSE publish needn't re-query.
+                notif_rows = _fanout_event(event_id=event.id, created_at=created_at, user_ids=target_user_ids)
 
-            if idem is not None:
-                idem.event = event
-                idem.save(update_fields=["event"])
+            if idem_id is not None:
+                IdempotencyKey.objects.filter(id=idem_id).update(event_id=event.id)
 
             # Publish to SSE subscribers only after the DB commit completes.
             # This keeps the stream consistent with polling/backfill.
@@ -131,58 +253,66 @@ class EventIngestView(APIView):
                 object_id_for_analytics = str(data["object_id"])
                 verb_for_analytics = str(data["verb"])
 
+                def _load_notif_rows(user_ids: list[int]) -> list[tuple[int, int]]:
+                    # Runs on an executor thread outside any request, so nothing else
+                    # would recycle its DB connection; do what the request cycle does.
+                    close_old_connections()
+                    try:
+                        return list(
+                            Notification.objects.filter(
+                                event_id=event.id,
+                                user_id__in=user_ids,
+                            ).values_list("id", "user_id")
+                        )
+                    finally:
+                        close_old_connections()
+
                 def _publish_after_commit() -> None:
                     # NOTE: broker is in-memory; avoid extra DB work when nobody is listening.
-                    # We check in the event loop since broker uses an asyncio lock.
                     async def _go() -> None:
-                        if not await broker.any_subscribers(target_ids_for_publish):
+                        # Only the recipients with an open stream matter; usually few or none.
+                        active = await broker.active_subscribers(target_ids_for_publish)
+                        if not active:
                             return
 
-                        rows = list(
-                            Notification.objects.filter(
-                                event_id=event.id,
-                                user_id__in=target_ids_for_publish,
-                            )
-                            .select_related("event")
-                            .values(
-                                "id",
-                                "user_id",
-                                "created_at",
-                                "read_at",
-                                "delivered_at",
-                                "event__id",
-                                "event__actor_id",
-                                "event__verb",
-                                "event__object_type",
-                                "event__object_id",
-                                "event__created_at",
-                            )
-                        )
-                        for r in rows:
-                            msg = {
-                                "notification_id": r["id"],
-                                "user_id": r["user_id"],
-                                "created_at": r["created_at"].isoformat(),
-                                "read_at": r["read_at"].isoformat() if r["read_at"] else None,
-                                "delivered_at": r["delivered_at"].isoformat() if r["delivered_at"] else None,
-                                "event": {
-                                    "event_id": r["event__id"],
-                                    "actor_id": r["event__actor_id"],
-                                    "verb": r["event__verb"],
-                                    "object_type": r["event__object_type"],
-                                    "object_id": r["event__object_id"],
-                                    "created_at": r["event__created_at"].isoformat(),
-                                },
+                        if notif_rows is not None:
+                            active_set = set(active)
+                            rows = [r for r in notif_rows if r[1] in active_set]
+                        else:
+                            # This backend couldn't return the inserted ids; look them up
+                            # off the event loop (the ORM is sync-only).
+                            rows = await sync_to_async(_load_notif_rows)(active)
+
+                        # Everything except the ids was just written by this request, so
+                        # the payload is built from memory rather than re-read.
+                        # Only the ids differ between recipients, so the timestamp and
+                        # the event sub-dict are built once and shared by every message.
+                        published_at = created_at.astimezone(UTC).isoformat()
+                        event_payload = {
+                            "event_id": event.id,
+                            "actor_id": event.actor_id,
+                            "verb": event.verb,
+                            "object_type": event.object_type,
+                            "object_id": event.object_id,
+                            "created_at": published_at,
+                        }
+                        await broker.publish_many(
+                            {
+                                int(user_id): {
+                                    "notification_id": notification_id,
+                                    "user_id": user_id,
+                                    "created_at": published_at,
+                                    "read_at": None,
+                                    "delivered_at": None,
+                                    "event": event_payload,
+                                }
+                                for notification_id, user_id in rows
                             }
-                            await broker.publish(int(r["user_id"]), msg)
+                        )
 
-                    # Run in whichever loop Django/ASGI is using.
-                    try:
-                        loop = asyncio.get_running_loop()
-                    except RuntimeError:
-                        asyncio.run(_go())
-                    else:
-                        loop.create_task(_go())
+                    # Fire and forget on the broker's loop thread; the response
+                    # doesn't wait for the fan-out.
+                    broker.submit(_go())
 
                 def _on_commit() -> None:
                     # Count by ingestion time for "as real-time as possible".
@@ -214,7 +344,7 @@ class FeedView(APIView):
     MAX_LIMIT = 200
 
     def get(self, request):
-        header_user_id = _get_header_user_id(request)
+        header_user_id = request.user_id
         if header_user_id is None:
             return Response(
                 {"detail": "Missing or invalid X-User-Id header."},
@@ -226,7 +356,7 @@ class FeedView(APIView):
         params = qs.validated_data
 
         user_id = int(params.get("user_id") or header_user_id)
-        if user_id != int(header_user_id):
+        if user_id != header_user_id:
             return Response(
                 {"detail": "user_id must match X-User-Id header."},
                 status=status.HTTP_403_FORBIDDEN,
@@ -242,30 +372,34 @@ class FeedView(APIView):
 
         feed_qs = (
             FeedItem.objects.filter(user_id=user_id)
-            .select_related("event")
             .order_by("-created_at", "-id")
+            .values("id", "created_at", *EVENT_ROW_FIELDS)
         )
 
         if cursor is not None:
-            feed_qs = feed_qs.filter(
-                Q(created_at__lt=cursor.created_at)
-                | Q(created_at=cursor.created_at, id__lt=cursor.feed_item_id)
+            # (created_at, id) < cursor, written so the leading created_at <= bound is
+            # a plain range: a single seek on feed_user_created_id_idx
+            # (user_id, -created_at, -id), with the OR only filtering the tie rows.
+            feed_qs = feed_qs.filter(created_at__lte=cursor.created_at).filter(
+                Q(created_at__lt=cursor.created_at) | Q(id__lt=cursor.feed_item_id)
             )
 
-        feed_items = list(feed_qs[:limit])
-        events = [fi.event for fi in feed_items]
+        # Fetch one extra row as a "more available" sentinel, so an exactly-full last
+        # page doesn't hand out a cursor to an empty page.
+        feed_rows = list(feed_qs[: limit + 1])
+        has_more = len(feed_rows) > limit
+        del feed_rows[limit:]
 
         next_cursor = None
-        if len(feed_items) == limit:
-            last = feed_items[-1]
-            next_cursor = encode_feed_cursor(last.created_at, last.id)
+        if has_more:
+            last = feed_rows[-1]
+            next_cursor = encode_feed_cursor(last["created_at"], last["id"])
 
-        return Response(
+        return _json_response(
             {
-                "items": EventOutSerializer(events, many=True).data,
+                "items": [serialize_event_row(r) for r in feed_rows],
                 "next_cursor": next_cursor,
-            },
-            status=status.HTTP_200_OK,
+            }
         )
 
 
@@ -281,7 +415,7 @@ class NotificationsView(APIView):
     MAX_LIMIT = 200
 
     def get(self, request):
-        header_user_id = _get_header_user_id(request)
+        header_user_id = request.user_id
         if header_user_id is None:
             return Response(
                 {"detail": "Missing or invalid X-User-Id header."},
@@ -293,7 +427,7 @@ class NotificationsView(APIView):
         params = qs.validated_data
 
         user_id = int(params.get("user_id") or header_user_id)
-        if user_id != int(header_user_id):
+        if user_id != header_user_id:
             return Response(
                 {"detail": "user_id must match X-User-Id header."},
                 status=status.HTTP_403_FORBIDDEN,
@@ -306,18 +440,17 @@ class NotificationsView(APIView):
 
         notif_qs = (
             Notification.objects.filter(user_id=user_id, id__gt=since)
-            .select_related("event")
             .order_by("id")
+            .values(*NOTIFICATION_ROW_FIELDS)
         )
-        notifications = list(notif_qs[:limit])
+        notif_rows = list(notif_qs[:limit])
 
-        next_since = notifications[-1].id if notifications else since
-        return Response(
+        next_since = notif_rows[-1]["id"] if notif_rows else since
+        return _json_response(
             {
-                "items": NotificationOutSerializer(notifications, many=True).data,
+                "items": [serialize_notification_row(r) for r in notif_rows],
                 "next_since": next_since,
-            },
-            status=status.HTTP_200_OK,
+            }
         )
 
 
@@ -337,7 +470,7 @@ class NotificationsStreamView(APIView):
         return view
 
     async def get(self, request):
-        header_user_id = _get_header_user_id(request)
+        header_user_id = request.user_id
         if header_user_id is None:
             return Response(
                 {"detail": "Missing or invalid X-User-Id header."},
@@ -349,7 +482,7 @@ class NotificationsStreamView(APIView):
             user_id = int(request.GET.get("user_id") or header_user_id)
         except (TypeError, ValueError):
             return Response({"detail": "Invalid user_id."}, status=status.HTTP_400_BAD_REQUEST)
-        if user_id != int(header_user_id):
+        if user_id != header_user_id:
             return Response(
                 {"detail": "user_id must match X-User-Id header."},
                 status=status.HTTP_403_FORBIDDEN,
@@ -361,31 +494,34 @@ class NotificationsStreamView(APIView):
         except (TypeError, ValueError):
             last_event_id = 0
 
+        def _load_backfill_rows() -> list[dict]:
+            return list(
+                Notification.objects.filter(user_id=user_id, id__gt=last_event_id)
+                .order_by("id")
+                .values(*NOTIFICATION_ROW_FIELDS)[:200]
+            )
+
         sub = await broker.subscribe(user_id)
 
         async def stream():
             try:
                 # Let browsers reconnect quickly.
-                yield "retry: 3000\n\n"
+                yield b"retry: 3000\n\n"
 
                 # Backfill from DB if the client is resuming.
                 if last_event_id > 0:
-                    rows = list(
-                        Notification.objects.filter(user_id=user_id, id__gt=last_event_id)
-                        .select_related("event")
-                        .order_by("id")[:200]
-                    )
-                    for n in rows:
-                        msg = NotificationOutSerializer(n).data
-                        yield format_sse(data=msg, event_id=n.id)
-
-                # Live stream
+                    # The ORM is sync-only; run the query on the worker thread so the
+                    # loop keeps serving other streams meanwhile.
+                    rows = await sync_to_async(_load_backfill_rows)()
+                    for r in rows:
+                        yield format_sse(data=serialize_notification_row(r), event_id=r["id"])
+
+                # Live stream. No per-connection timer: the broker's shared ticker
+                # pushes keep-alive frames to idle subscribers.
                 while True:
-                    try:
-                        msg = await asyncio.wait_for(sub.queue.get(), timeout=15.0)
-                        yield format_sse(data=msg, event_id=int(msg.get("notification_id") or 0))
-                    except TimeoutError:
-                        yield ": keep-alive\n\n"
+                    await sub.ready.wait()
+                    for frame in sub.drain():
+                        yield frame
             finally:
                 await broker.unsubscribe(sub)
 
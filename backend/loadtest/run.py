@@ -1,7 +1,10 @@
 from __future__ import annotations
 
 import argparse
+import array
+import base64
 import csv
+import functools
 import json
 import os
 import re
@@ -9,26 +12,45 @@ import shutil
 import subprocess
 import sys
 import time
-from dataclasses import dataclass, asdict
-from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
+from datetime import UTC, datetime
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
+
+try:
+    import psutil  # type: ignore
+except ImportError:  # pragma: no cover
+    psutil = None
 
 
 ROOT = Path(__file__).resolve().parents[1]
 BACKEND_DIR = ROOT / "app" / "backend"
 
 
-AB_RPS_RE = re.compile(r"Requests per second:\s+([0-9.]+)")
-AB_TPR_RE = re.compile(r"Time per request:\s+([0-9.]+)\s+\[ms\]\s+\(mean\)")
-AB_TPR_ACROSS_RE = re.compile(
-    r"Time per request:\s+([0-9.]+)\s+\[ms\]\s+\(mean, across all concurrent requests\)"
-)
-AB_CONN_TOTAL_RE = re.compile(
-    r"^Total:\s+(?P<min>\d+)\s+(?P<mean>\d+)\s+(?P<sd>[0-9.]+)\s+(?P<median>\d+)\s+(?P<max>\d+)",
+# ab's report is ASCII; the patterns work on its raw stdout bytes (no decode pass).
+# One alternation covers every summary line, so that part is scanned once; the
+# branch that matched is identified by its last capture group (see parse_ab_output).
+AB_REPORT_RE = re.compile(
+    rb"Requests per second:\s+(?P<rps>[0-9.]+)"
+    rb"|Time per request:\s+(?P<tpr>[0-9.]+)\s+\[ms\]\s+"
+    rb"\(mean(?P<tpr_across>, across all concurrent requests)?\)"
+    rb"|^Total:\s+(?P<min>\d+)\s+(?P<mean>\d+)\s+(?P<sd>[0-9.]+)\s+(?P<median>\d+)\s+(?P<max>\d+)",
     re.MULTILINE,
 )
-AB_PERCENTILE_RE = re.compile(r"^\s*(\d+)%\s+(\d+)", re.MULTILINE)
+# The percentile table is always the tail of the report, after this heading.
+AB_PERCENTILE_MARKER = b"Percentage of the requests served"
+AB_PERCENTILE_RE = re.compile(rb"^\s*(\d+)%\s+(\d+)", re.MULTILINE)
+# Only these ab percentile rows are reported; keyed by the raw digits so the
+# other rows (66/75/80/98/100%) are never converted.
+_AB_PERCENTILE_KEYS = {b"50": "p50_ms", b"90": "p90_ms", b"95": "p95_ms", b"99": "p99_ms"}
+
+# wrk (run with --latency). Durations carry a unit suffix: us, ms, s (or m).
+WRK_RPS_RE = re.compile(rb"^Requests/sec:\s+([0-9.]+)", re.MULTILINE)
+WRK_REQUESTS_RE = re.compile(rb"^\s*(\d+) requests in ", re.MULTILINE)
+WRK_LAT_RE = re.compile(rb"^\s*Latency\s+([0-9.]+)(us|ms|s|m)\s+[0-9.]+\w+\s+([0-9.]+)(us|ms|s|m)", re.MULTILINE)
+WRK_PCT_RE = re.compile(rb"^\s*(\d+(?:\.\d+)?)%\s+([0-9.]+)(us|ms|s|m)\s*$", re.MULTILINE)
+_WRK_UNIT_MS = {b"us": 0.001, b"ms": 1.0, b"s": 1000.0, b"m": 60_000.0}
 
 
 @dataclass
@@ -56,9 +78,17 @@ class RunResult:
     notes: str = ""
 
 
+# Flat record of scalars: plain getattr per field beats the recursive asdict().
+_RESULT_FIELDS = tuple(f.name for f in fields(RunResult))
+
+
+def _result_dict(r: RunResult) -> dict[str, Any]:
+    return {name: getattr(r, name) for name in _RESULT_FIELDS}
+
+
 def _utc_now() -> str:
     # Python 3.14 deprecates utcnow(); use timezone-aware UTC timestamps.
-    return datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+    return datetime.now(UTC).isoformat(timespec="seconds").replace("+00:00", "Z")
 
 
 def _run(cmd: list[str], *, cwd: Path | None = None, timeout_s: int | None = None) -> subprocess.CompletedProcess:
@@ -66,70 +96,237 @@ def _run(cmd: list[str], *, cwd: Path | None = None, timeout_s: int | None = Non
         cmd,
         cwd=str(cwd) if cwd else None,
         capture_output=True,
-        text=True,
         timeout=timeout_s,
     )
 
 
-def _get_process_snapshot_windows(pid: int) -> tuple[float | None, float | None]:
+def _run_streamed(cmd: list[str], *, cwd: Path | None, log_path: Path, timeout_s: int | None = None) -> int:
     """
-    Returns (cpu_seconds, working_set_mb) for a PID on Windows via PowerShell.
+    Run a long command with stdout+stderr going straight to `log_path`.
+
+    The child writes to the file descriptor itself, so nothing is buffered in this
+    process however much it logs. Returns the exit code.
     """
 
-    ps = (
-        "powershell",
-        "-NoProfile",
-        "-Command",
-        f"$p=Get-Process -Id {pid} -ErrorAction SilentlyContinue; "
-        "if($null -eq $p){ exit 1 } "
-        "[Console]::WriteLine(($p.CPU)); "
-        "[Console]::WriteLine(($p.WorkingSet64/1MB));",
-    )
-    cp = _run(list(ps), timeout_s=10)
-    if cp.returncode != 0:
-        return (None, None)
-    lines = [ln.strip() for ln in cp.stdout.splitlines() if ln.strip()]
-    if len(lines) < 2:
-        return (None, None)
+    with log_path.open("wb") as log:
+        proc = subprocess.Popen(cmd, cwd=str(cwd) if cwd else None, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            return proc.wait(timeout=timeout_s)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            raise
+
+
+def _tail(path: Path, max_bytes: int = 4096) -> str:
+    with path.open("rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - max_bytes))
+        return f.read().decode("utf-8", "replace")
+
+
+class _WinProcSampler:
+    """
+    (cpu_seconds, working_set_mb) for a PID on Windows, read straight from kernel32.
+
+    The process handle is opened once; each call is two syscalls, no subprocess. Output
+    structs are allocated per call, so concurrent --parallel runs can share a sampler.
+    """
+
+    _ACCESS = 0x0400 | 0x0010  # PROCESS_QUERY_INFORMATION | PROCESS_VM_READ
+
+    def __init__(self, pid: int) -> None:
+        import ctypes
+        from ctypes import wintypes
+
+        class _MemoryCounters(ctypes.Structure):
+            # PROCESS_MEMORY_COUNTERS
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        # A private WinDLL, so these prototypes don't leak into ctypes.windll.
+        k32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        k32.OpenProcess.argtypes = (wintypes.DWORD, wintypes.BOOL, wintypes.DWORD)
+        k32.OpenProcess.restype = wintypes.HANDLE
+        k32.GetProcessTimes.argtypes = (wintypes.HANDLE,) + (ctypes.POINTER(wintypes.FILETIME),) * 4
+        k32.GetProcessTimes.restype = wintypes.BOOL
+        # psapi's GetProcessMemoryInfo, exported by kernel32 itself since Windows 7.
+        k32.K32GetProcessMemoryInfo.argtypes = (wintypes.HANDLE, ctypes.POINTER(_MemoryCounters), wintypes.DWORD)
+        k32.K32GetProcessMemoryInfo.restype = wintypes.BOOL
+        k32.CloseHandle.argtypes = (wintypes.HANDLE,)
+        k32.CloseHandle.restype = wintypes.BOOL
+
+        self._k32 = k32
+        self._byref = ctypes.byref
+        self._filetime = wintypes.FILETIME
+        self._counters_cls = _MemoryCounters
+        self._counters_size = ctypes.sizeof(_MemoryCounters)
+        self._handle = k32.OpenProcess(self._ACCESS, False, pid)
+
+    def __call__(self) -> tuple[float | None, float | None]:
+        if not self._handle:
+            return (None, None)
+        byref = self._byref
+        creation, exit_, kernel, user = (self._filetime() for _ in range(4))
+        if not self._k32.GetProcessTimes(self._handle, byref(creation), byref(exit_), byref(kernel), byref(user)):
+            return (None, None)
+        counters = self._counters_cls(cb=self._counters_size)
+        if not self._k32.K32GetProcessMemoryInfo(self._handle, byref(counters), counters.cb):
+            return (None, None)
+        # FILETIME counts 100 ns ticks.
+        ticks = sum((ft.dwHighDateTime << 32) | ft.dwLowDateTime for ft in (kernel, user))
+        return (ticks / 1e7, counters.WorkingSetSize / (1024 * 1024))
+
+    def __del__(self) -> None:
+        handle = getattr(self, "_handle", None)
+        if handle:
+            self._k32.CloseHandle(handle)
+            self._handle = None
+
+
+ProcessSampler = Callable[[], "tuple[float | None, float | None]"]
+
+
+def _make_process_sampler(pid: int) -> ProcessSampler:
+    """
+    Build a (cpu_seconds, working_set_mb) sampler for `pid`, resolved once.
+
+    psutil reads the counters in-process; without it, Windows falls back to the
+    kernel32 calls in _WinProcSampler and other platforms report nothing.
+    """
+
+    if psutil is None:
+        if os.name != "nt":
+            return lambda: (None, None)
+        return _WinProcSampler(pid)
+
     try:
-        return (float(lines[0]), float(lines[1]))
-    except ValueError:
-        return (None, None)
+        proc = psutil.Process(pid)
+    except psutil.Error:
+        return lambda: (None, None)
 
+    def sample() -> tuple[float | None, float | None]:
+        try:
+            with proc.oneshot():
+                times = proc.cpu_times()
+                mem = proc.memory_info()
+        except psutil.Error:
+            return (None, None)
+        # `wset` is the Windows working set; rss is the same notion elsewhere.
+        ws = getattr(mem, "wset", mem.rss)
+        return (times.user + times.system, ws / (1024 * 1024))
+
+    return sample
+
+
+def parse_ab_output(text: bytes) -> dict[str, Any]:
+    out: dict[str, Any] = {
+        "rps": None,
+        "tpr_ms_mean": None,
+        "tpr_ms_mean_across": None,
+        "conn_total_ms_min": None,
+        "conn_total_ms_mean": None,
+        "conn_total_ms_median": None,
+        "conn_total_ms_max": None,
+        "p50_ms": None,
+        "p90_ms": None,
+        "p95_ms": None,
+        "p99_ms": None,
+    }
+
+    # Summary lines come before the percentile table and the table is the tail, so
+    # each pattern only scans its own part of the report (pos/endpos, no slicing).
+    split = text.find(AB_PERCENTILE_MARKER)
+    summary_end = split if split >= 0 else len(text)
+
+    # First occurrence wins for the summary lines.
+    for m in AB_REPORT_RE.finditer(text, 0, summary_end):
+        kind = m.lastgroup
+        if kind == "rps":
+            if out["rps"] is None:
+                out["rps"] = float(m["rps"])
+        elif kind == "tpr":
+            if out["tpr_ms_mean"] is None:
+                out["tpr_ms_mean"] = float(m["tpr"])
+        elif kind == "tpr_across":
+            if out["tpr_ms_mean_across"] is None:
+                out["tpr_ms_mean_across"] = float(m["tpr"])
+        elif kind == "max" and out["conn_total_ms_min"] is None:
+            out["conn_total_ms_min"] = int(m["min"])
+            out["conn_total_ms_mean"] = int(m["mean"])
+            out["conn_total_ms_median"] = int(m["median"])
+            out["conn_total_ms_max"] = int(m["max"])
+
+    if split >= 0:
+        for pct, value in AB_PERCENTILE_RE.findall(text, split):
+            key = _AB_PERCENTILE_KEYS.get(pct)
+            if key:
+                out[key] = int(value)
 
-def parse_ab_output(text: str) -> dict[str, Any]:
-    out: dict[str, Any] = {}
+    return out
 
-    m = AB_RPS_RE.search(text)
-    out["rps"] = float(m.group(1)) if m else None
 
-    m = AB_TPR_RE.search(text)
-    out["tpr_ms_mean"] = float(m.group(1)) if m else None
+def parse_wrk_output(text: bytes) -> dict[str, Any]:
+    """
+    Parse `wrk --latency` output into the same keys as parse_ab_output.
+
+    Of ab's connection-time table wrk only has the max latency, and it reports no
+    p95, so the rest stays None; the across-all-requests mean is derived from rps
+    the way ab defines it.
+    """
+
+    out: dict[str, Any] = dict.fromkeys(
+        (
+            "rps",
+            "tpr_ms_mean",
+            "tpr_ms_mean_across",
+            "conn_total_ms_min",
+            "conn_total_ms_mean",
+            "conn_total_ms_median",
+            "conn_total_ms_max",
+            "p50_ms",
+            "p90_ms",
+            "p95_ms",
+            "p99_ms",
+            "requests",
+        )
+    )
 
-    m = AB_TPR_ACROSS_RE.search(text)
-    out["tpr_ms_mean_across"] = float(m.group(1)) if m else None
+    m = WRK_RPS_RE.search(text)
+    if m:
+        out["rps"] = float(m.group(1))
+        if out["rps"] > 0:
+            out["tpr_ms_mean_across"] = round(1000.0 / out["rps"], 3)
 
-    m = AB_CONN_TOTAL_RE.search(text)
+    m = WRK_REQUESTS_RE.search(text)
     if m:
-        out["conn_total_ms_min"] = int(m.group("min"))
-        out["conn_total_ms_mean"] = int(m.group("mean"))
-        out["conn_total_ms_median"] = int(m.group("median"))
-        out["conn_total_ms_max"] = int(m.group("max"))
-    else:
-        out["conn_total_ms_min"] = None
-        out["conn_total_ms_mean"] = None
-        out["conn_total_ms_median"] = None
-        out["conn_total_ms_max"] = None
+        out["requests"] = int(m.group(1))
 
-    percentiles = {int(p): int(v) for p, v in AB_PERCENTILE_RE.findall(text)}
-    out["p50_ms"] = percentiles.get(50)
-    out["p90_ms"] = percentiles.get(90)
-    out["p95_ms"] = percentiles.get(95)
-    out["p99_ms"] = percentiles.get(99)
+    m = WRK_LAT_RE.search(text)
+    if m:
+        out["tpr_ms_mean"] = round(float(m.group(1)) * _WRK_UNIT_MS[m.group(2)], 3)
+        out["conn_total_ms_max"] = round(float(m.group(3)) * _WRK_UNIT_MS[m.group(4)])
+
+    for p, v, unit in WRK_PCT_RE.findall(text):
+        key = {50.0: "p50_ms", 90.0: "p90_ms", 95.0: "p95_ms", 99.0: "p99_ms"}.get(float(p))
+        if key:
+            out[key] = round(float(v) * _WRK_UNIT_MS[unit])
 
     return out
 
 
+# Resolved once per process; a missing tool raises, so that isn't cached.
+@functools.lru_cache(maxsize=1)
 def ensure_ab() -> str:
     # Prefer a self-contained Apache bin/ directory (ab.exe + DLLs).
     # Running a "loose" ab.exe without its sibling DLLs typically fails on Windows
@@ -152,6 +349,14 @@ def ensure_ab() -> str:
     )
 
 
+@functools.lru_cache(maxsize=1)
+def ensure_wrk() -> str:
+    wrk = shutil.which("wrk")
+    if wrk:
+        return wrk
+    raise SystemExit("wrk not found. Put `wrk` on PATH, or use --driver ab.")
+
+
 def _parse_int_list(value: str, *, name: str) -> list[int]:
     """
     Parse comma-separated ints: "100,200" -> [100, 200]
@@ -176,20 +381,78 @@ def _parse_str_set(value: str) -> set[str]:
     return {p.strip() for p in value.split(",") if p.strip()}
 
 
-def seed_dataset(python_exe: str, events: int, hot_user_id: int) -> None:
+def seed_dataset(
+    python_exe: str,
+    events: int,
+    hot_user_id: int,
+    *,
+    tmp_dir: Path,
+    force: bool = False,
+    incremental: bool = False,
+) -> bool:
+    """
+    Reset and seed the DB with `events` stored events, unless it already holds exactly
+    that dataset (per the fingerprint left by the last successful seed, and not marked
+    dirty since; see mark_seed_dirty()). Returns True if it seeded.
+
+    With `incremental`, a dataset no larger than `events` already in the DB is topped
+    up to exactly `events` rows instead of being rebuilt. `force` always rebuilds.
+    """
+
+    fingerprint_path = tmp_dir / "seed_fingerprint.json"
+    prev: dict[str, Any] = {}
+    if not force and fingerprint_path.exists():
+        try:
+            prev = json.loads(fingerprint_path.read_text(encoding="utf-8"))
+        except ValueError:
+            prev = {}
+        if prev.get("events") == events and prev.get("hot_user_id") == hot_user_id and not prev.get("dirty"):
+            return False
+
+    prev_events = prev.get("events") if prev.get("hot_user_id") == hot_user_id else None
+    if incremental and isinstance(prev_events, int) and 0 < prev_events <= events:
+        # The delta comes from the live Event count, not the fingerprint: events runs may
+        # have added rows since (seed_events resets if they overshoot `events`).
+        size_args = ["--append", "--events-total", str(events)]
+    else:
+        size_args = ["--reset", "--events", str(events)]
+
     cmd = [
         python_exe,
         "manage.py",
         "seed_events",
-        "--reset",
-        "--events",
-        str(events),
+        *size_args,
         "--hot-user-id",
         str(hot_user_id),
     ]
-    cp = _run(cmd, cwd=BACKEND_DIR, timeout_s=60 * 60)
-    if cp.returncode != 0:
-        raise RuntimeError(f"Seeding failed:\n{cp.stdout}\n{cp.stderr}")
+    # Drop the old fingerprint first: a failed or interrupted seed leaves the DB in an
+    # unknown state.
+    fingerprint_path.unlink(missing_ok=True)
+    log_path = tmp_dir / f"seed_{events}.log"
+    rc = _run_streamed(cmd, cwd=BACKEND_DIR, log_path=log_path, timeout_s=60 * 60)
+    if rc != 0:
+        raise RuntimeError(f"Seeding failed (exit {rc}); full log: {log_path}\n{_tail(log_path)}")
+    fingerprint_path.write_text(
+        json.dumps({"events": events, "hot_user_id": hot_user_id, "ts": _utc_now()}),
+        encoding="utf-8",
+    )
+    return True
+
+
+def mark_seed_dirty(tmp_dir: Path) -> None:
+    """
+    Flag the seeded dataset as modified: POST /api/events runs add Event, FeedItem and
+    Notification rows, so the DB no longer matches its fingerprint and must be reseeded.
+    """
+
+    fingerprint_path = tmp_dir / "seed_fingerprint.json"
+    try:
+        prev = json.loads(fingerprint_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        # No (readable) fingerprint: nothing will be skipped anyway.
+        return
+    prev["dirty"] = True
+    fingerprint_path.write_text(json.dumps(prev), encoding="utf-8")
 
 
 def run_ab(
@@ -199,10 +462,10 @@ def run_ab(
     url: str,
     concurrency: int,
     requests: int,
-    headers: list[str],
+    headers: tuple[str, ...],
     body_path: Path | None,
     content_type: str | None,
-) -> str:
+) -> bytes:
     cmd = [ab, "-c", str(concurrency), "-n", str(requests)]
     for h in headers:
         cmd += ["-H", h]
@@ -217,59 +480,149 @@ def run_ab(
     cp = _run(cmd, cwd=ROOT, timeout_s=60 * 30)
     if cp.returncode != 0:
         # ab sometimes returns non-zero for socket errors; keep output for diagnostics.
-        return cp.stdout + "\n" + cp.stderr
+        return b"\n".join((cp.stdout, cp.stderr))
     return cp.stdout
 
 
-def write_report(results: list[RunResult], out_dir: Path) -> None:
+def run_wrk(
+    wrk: str,
+    *,
+    url: str,
+    concurrency: int,
+    duration_s: int,
+    headers: tuple[str, ...],
+    script_path: Path | None,
+) -> bytes:
+    # wrk needs connections >= threads.
+    threads = max(1, min(concurrency, os.cpu_count() or 1))
+    cmd = [wrk, "--latency", "-t", str(threads), "-c", str(concurrency), "-d", f"{duration_s}s"]
+    for h in headers:
+        cmd += ["-H", h]
+    if script_path:
+        cmd += ["-s", str(script_path)]
+    cmd.append(url)
+
+    cp = _run(cmd, cwd=ROOT, timeout_s=duration_s + 60 * 5)
+    if cp.returncode != 0:
+        return b"\n".join((cp.stdout, cp.stderr))
+    return cp.stdout
+
+
+def _load_results(jsonl_path: Path) -> list[RunResult]:
+    """
+    Read a previous sweep's results.jsonl (one RunResult per line).
+    """
+
+    if not jsonl_path.exists():
+        return []
+    out: list[RunResult] = []
+    with jsonl_path.open("r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                out.append(RunResult(**json.loads(line)))
+    return out
+
+
+class _ResultWriter:
+    """
+    Appends each RunResult to results.csv and results.jsonl as soon as it exists,
+    flushing per row, so a crash mid-sweep keeps everything measured so far.
+    """
+
+    def __init__(self, out_dir: Path, *, append: bool = False) -> None:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        csv_path = out_dir / "results.csv"
+        write_header = not (append and csv_path.exists() and csv_path.stat().st_size > 0)
+        mode = "a" if append else "w"
+        self._csv_f = csv_path.open(mode, newline="", encoding="utf-8")
+        self._jsonl_f = (out_dir / "results.jsonl").open(mode, encoding="utf-8")
+        self._csv = csv.writer(self._csv_f)
+        if write_header:
+            self._csv.writerow(_RESULT_FIELDS)
+
+    def write(self, r: RunResult) -> None:
+        row = _result_dict(r)
+        self._csv.writerow(row.values())
+        self._csv_f.flush()
+        self._jsonl_f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._jsonl_f.flush()
+
+    def close(self) -> None:
+        self._csv_f.close()
+        self._jsonl_f.close()
+
+
+def _f32_b64(values: list[float]) -> str:
+    """
+    Pack floats as little-endian float32 and base64 them, for a JS Float32Array.
+    """
+
+    packed = array.array("f", values)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return base64.b64encode(packed.tobytes()).decode("ascii")
+
+
+def write_report(results: list[RunResult], out_dir: Path, *, generated_at: str) -> None:
+    # results.csv / results.jsonl are streamed by main() as runs finish.
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    csv_path = out_dir / "results.csv"
-    jsonl_path = out_dir / "results.jsonl"
     md_path = out_dir / "report.md"
     html_path = out_dir / "report.html"
 
-    # CSV
-    with csv_path.open("w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=list(asdict(results[0]).keys()))
-        w.writeheader()
-        for r in results:
-            w.writerow(asdict(r))
-
-    # JSONL
-    with jsonl_path.open("w", encoding="utf-8") as f:
-        for r in results:
-            f.write(json.dumps(asdict(r), ensure_ascii=False) + "\n")
-
     # Markdown summary
-    by_endpoint: dict[str, list[RunResult]] = {}
-    for r in results:
-        by_endpoint.setdefault(r.endpoint, []).append(r)
-
-    lines: list[str] = []
-    lines.append("## Load test report")
-    lines.append("")
-    lines.append(f"- Generated: `{_utc_now()}`")
-    lines.append(f"- Rows: **{len(results)}**")
-    lines.append("")
-    lines.append("### Summary (Requests/sec)")
-    lines.append("")
-    lines.append("| endpoint | dataset_events | concurrency | rps | mean ms | across-all ms | ws MB | cpu s |")
-    lines.append("|---|---:|---:|---:|---:|---:|---:|---:|")
-    for r in results:
-        lines.append(
-            f"| `{r.endpoint}` | {r.dataset_events:,} | {r.concurrency} | {r.rps or ''} | {r.time_per_request_ms_mean or ''} | {r.time_per_request_ms_mean_across or ''} | {r.working_set_mb or ''} | {r.cpu_seconds or ''} |"
+    row_fmt = "| `{}` | {:,} | {} | {} | {} | {} | {} | {} |".format
+    table = "\n".join(
+        row_fmt(
+            r.endpoint,
+            r.dataset_events,
+            r.concurrency,
+            r.rps or "",
+            r.time_per_request_ms_mean or "",
+            r.time_per_request_ms_mean_across or "",
+            r.working_set_mb or "",
+            r.cpu_seconds or "",
         )
-    lines.append("")
-    lines.append("### Charts")
-    lines.append("")
-    lines.append("Open `loadtest/report.html` for interactive charts.")
-    lines.append("")
-
-    md_path.write_text("\n".join(lines), encoding="utf-8")
+        for r in results
+    )
+    md_path.write_text(
+        "\n".join(
+            (
+                "## Load test report",
+                "",
+                f"- Generated: `{generated_at}`",
+                f"- Rows: **{len(results)}**",
+                "",
+                "### Summary (Requests/sec)",
+                "",
+                "| endpoint | dataset_events | concurrency | rps | mean ms | across-all ms | ws MB | cpu s |",
+                "|---|---:|---:|---:|---:|---:|---:|---:|",
+                table,
+                "",
+                "### Charts",
+                "",
+                "Open `loadtest/report.html` for interactive charts.",
+                "",
+            )
+        ),
+        encoding="utf-8",
+    )
 
     # HTML charts (Chart.js from CDN)
-    data_json = json.dumps([asdict(r) for r in results], ensure_ascii=False)
+    # The charts only need five numeric columns, so they're embedded column-wise instead
+    # of as a JSON array of every row. The measured columns are base64 float32 blobs
+    # (missing values as NaN); the integer label columns stay compact JSON, since
+    # float32 can't hold dataset sizes above 2**24 exactly.
+    # Endpoint names are a small lookup table; each row stores its index into it.
+    nan = float("nan")
+    endpoint_names = sorted({r.endpoint for r in results})
+    endpoint_index = {name: i for i, name in enumerate(endpoint_names)}
+    endpoints_json = json.dumps(endpoint_names, ensure_ascii=False)
+    endpoint_json = json.dumps([endpoint_index[r.endpoint] for r in results], separators=(",", ":"))
+    dataset_json = json.dumps([r.dataset_events for r in results], separators=(",", ":"))
+    concurrency_json = json.dumps([r.concurrency for r in results], separators=(",", ":"))
+    rps_b64 = _f32_b64([nan if r.rps is None else r.rps for r in results])
+    tpr_b64 = _f32_b64([nan if r.time_per_request_ms_mean is None else r.time_per_request_ms_mean for r in results])
     html = f"""<!doctype html>
 <html>
 <head>
@@ -285,7 +638,7 @@ def write_report(results: list[RunResult], out_dir: Path) -> None:
 </head>
 <body>
   <h2>Load test report</h2>
-  <p>Generated: <code>{_utc_now()}</code></p>
+  <p>Generated: <code>{generated_at}</code></p>
   <div class="grid">
     <div>
       <h3>Requests/sec vs concurrency</h3>
@@ -298,30 +651,36 @@ def write_report(results: list[RunResult], out_dir: Path) -> None:
   </div>
 
   <script>
-    const rows = {data_json};
-    function groupBy(arr, keyFn) {{
-      const m = new Map();
-      for (const x of arr) {{
-        const k = keyFn(x);
-        if (!m.has(k)) m.set(k, []);
-        m.get(k).push(x);
-      }}
-      return m;
+    function f32(b64) {{
+      return new Float32Array(Uint8Array.from(atob(b64), c => c.charCodeAt(0)).buffer);
     }}
+    const endpoints = {endpoints_json};
+    const endpoint = {endpoint_json};
+    const datasetEvents = {dataset_json};
+    const concurrency = {concurrency_json};
+    const rps = f32("{rps_b64}");
+    const tpr = f32("{tpr_b64}");
+
+    // Create datasets: one line per (endpoint,dataset_events), as lists of row indices
+    const grouped = new Map();
+    for (let i = 0; i < concurrency.length; i++) {{
+      const k = `${{endpoints[endpoint[i]]}}|${{datasetEvents[i]}}`;
+      if (!grouped.has(k)) grouped.set(k, []);
+      grouped.get(k).push(i);
+    }}
+    const labels = [...new Set(concurrency)].sort((a,b)=>a-b);
 
-    // Create datasets: one line per (endpoint,dataset_events)
-    const grouped = groupBy(rows, r => `${{r.endpoint}}|${{r.dataset_events}}`);
-    const labels = [...new Set(rows.map(r => r.concurrency))].sort((a,b)=>a-b);
-
-    function mkDatasets(valueKey) {{
+    function mkDatasets(values) {{
       const out = [];
-      for (const [k, arr] of grouped.entries()) {{
-        arr.sort((a,b)=>a.concurrency-b.concurrency);
+      for (const [k, idx] of grouped.entries()) {{
         const label = k;
-        const map = new Map(arr.map(r => [r.concurrency, r[valueKey]]));
+        const map = new Map(idx.map(i => [concurrency[i], values[i]]));
         out.push({{
           label,
-          data: labels.map(c => map.get(c) ?? null),
+          data: labels.map(c => {{
+            const v = map.get(c);
+            return v === undefined || Number.isNaN(v) ? null : v;
+          }}),
           spanGaps: true,
         }});
       }}
@@ -332,7 +691,7 @@ def write_report(results: list[RunResult], out_dir: Path) -> None:
       type: 'line',
       data: {{
         labels,
-        datasets: mkDatasets('rps'),
+        datasets: mkDatasets(rps),
       }},
       options: {{
         responsive: true,
@@ -348,7 +707,7 @@ def write_report(results: list[RunResult], out_dir: Path) -> None:
       type: 'line',
       data: {{
         labels,
-        datasets: mkDatasets('time_per_request_ms_mean'),
+        datasets: mkDatasets(tpr),
       }},
       options: {{
         responsive: true,
@@ -363,7 +722,128 @@ def write_report(results: list[RunResult], out_dir: Path) -> None:
 </body>
 </html>
 """
-    html_path.write_text(html, encoding="utf-8")
+    html_path.write_bytes(html.encode("utf-8"))
+
+
+@dataclass(frozen=True)
+class _Endpoint:
+    """
+    Everything about one benchmarked endpoint that doesn't depend on concurrency.
+    """
+
+    name: str
+    method: str
+    url: str
+    headers: tuple[str, ...]
+    body_path: Path | None
+    content_type: str | None
+    wrk_script: Path | None
+
+
+def _make_endpoint(
+    name: str,
+    method: str,
+    url: str,
+    *,
+    driver: str,
+    hot_user_id: int,
+    post_body: Path,
+) -> _Endpoint:
+    is_post = method == "POST"
+    return _Endpoint(
+        name=name,
+        method=method,
+        url=url,
+        headers=(
+            f"X-User-Id: {hot_user_id if name != 'events' else 1}",
+            "Accept: application/json",
+        ),
+        body_path=post_body if is_post else None,
+        content_type="application/json" if is_post else None,
+        wrk_script=post_body.with_suffix(".lua") if is_post and driver == "wrk" else None,
+    )
+
+
+def _run_one(
+    tool: str,
+    *,
+    driver: str,
+    duration_s: int,
+    events: int,
+    endpoint: _Endpoint,
+    concurrency: int,
+    sample_process: ProcessSampler | None,
+) -> RunResult:
+    c = concurrency
+    n = 10 * c
+
+    cpu_before = ws_before = None
+    cpu_after = ws_after = None
+    if sample_process:
+        cpu_before, ws_before = sample_process()
+
+    if driver == "wrk":
+        # wrk runs for a duration rather than a request count; the POST body and
+        # content type come from the Lua script written next to the JSON body.
+        output = run_wrk(
+            tool,
+            url=endpoint.url,
+            concurrency=c,
+            duration_s=duration_s,
+            headers=endpoint.headers,
+            script_path=endpoint.wrk_script,
+        )
+        parsed = parse_wrk_output(output)
+        n = parsed["requests"] or 0
+    else:
+        output = run_ab(
+            tool,
+            method=endpoint.method,
+            url=endpoint.url,
+            concurrency=c,
+            requests=n,
+            headers=endpoint.headers,
+            body_path=endpoint.body_path,
+            content_type=endpoint.content_type,
+        )
+        parsed = parse_ab_output(output)
+    finished_at = _utc_now()
+
+    if sample_process:
+        cpu_after, ws_after = sample_process()
+
+    cpu_seconds = None
+    working_set_mb = None
+    if cpu_before is not None and cpu_after is not None:
+        cpu_seconds = max(0.0, cpu_after - cpu_before)
+    if ws_after is not None:
+        working_set_mb = ws_after
+
+    print(f"[{events:,}] {endpoint.name} c={c} n={n} rps={parsed['rps']} mean_ms={parsed['tpr_ms_mean']}")
+
+    return RunResult(
+        timestamp_utc=finished_at,
+        dataset_events=events,
+        endpoint=endpoint.name,
+        method=endpoint.method,
+        url=endpoint.url,
+        concurrency=c,
+        requests=n,
+        rps=parsed["rps"],
+        time_per_request_ms_mean=parsed["tpr_ms_mean"],
+        time_per_request_ms_mean_across=parsed["tpr_ms_mean_across"],
+        conn_total_ms_min=parsed["conn_total_ms_min"],
+        conn_total_ms_mean=parsed["conn_total_ms_mean"],
+        conn_total_ms_median=parsed["conn_total_ms_median"],
+        conn_total_ms_max=parsed["conn_total_ms_max"],
+        p50_ms=parsed["p50_ms"],
+        p90_ms=parsed["p90_ms"],
+        p95_ms=parsed["p95_ms"],
+        p99_ms=parsed["p99_ms"],
+        cpu_seconds=cpu_seconds,
+        working_set_mb=working_set_mb,
+        notes="",
+    )
 
 
 def main() -> None:
@@ -388,9 +868,46 @@ def main() -> None:
         default="",
         help="Optional comma-separated endpoints to benchmark: events,feed,notifications,top",
     )
+    ap.add_argument(
+        "--parallel",
+        type=int,
+        default=1,
+        help="Run up to N ab clients at once per dataset (default 1: one run at a time, "
+        "so each row measures a single client; with N > 1 the --server-pid CPU deltas overlap).",
+    )
+    ap.add_argument(
+        "--driver",
+        choices=("ab", "wrk"),
+        default="ab",
+        help="Load generator: ab (default) or wrk (multi-threaded; needs `wrk` on PATH).",
+    )
+    ap.add_argument(
+        "--duration",
+        type=int,
+        default=10,
+        help="Seconds per run with --driver wrk (ab uses 10 x concurrency requests instead).",
+    )
+    ap.add_argument(
+        "--append",
+        action="store_true",
+        help="Keep the rows already in <out-dir>/results.jsonl, add this sweep's rows, and rebuild "
+        "the reports over all of them.",
+    )
+    ap.add_argument(
+        "--reseed",
+        action="store_true",
+        help="Seed every dataset even if the DB already holds it (see .tmp/seed_fingerprint.json).",
+    )
+    ap.add_argument(
+        "--incremental-seed",
+        action="store_true",
+        help="Run datasets smallest first and grow the DB between them by appending only the "
+        "missing events, instead of resetting and reseeding each one from scratch.",
+    )
     args = ap.parse_args()
 
-    ab = ensure_ab()
+    tool = ensure_wrk() if args.driver == "wrk" else ensure_ab()
+    sample_process = _make_process_sampler(args.server_pid) if args.server_pid else None
     base_url = args.base_url.rstrip("/")
     out_dir = Path(args.out_dir)
 
@@ -410,10 +927,20 @@ def main() -> None:
         ),
         encoding="utf-8",
     )
+    if args.driver == "wrk":
+        # wrk takes the POST body from a Lua script (long-bracket string: no escaping).
+        post_body.with_suffix(".lua").write_text(
+            'wrk.method = "POST"\n'
+            f"wrk.body = [[{post_body.read_text(encoding='utf-8')}]]\n"
+            'wrk.headers["Content-Type"] = "application/json"\n',
+            encoding="utf-8",
+        )
 
     datasets = _parse_int_list(args.datasets, name="datasets") or [100_000, 300_000, 500_000, 700_000, 900_000]
     concurrencies = _parse_int_list(args.concurrencies, name="concurrencies") or [200, 600, 1000, 1400, 1800]
     endpoint_filter = _parse_str_set(args.endpoints)
+    if args.incremental_seed:
+        datasets.sort()
 
     endpoints = [
         ("events", "POST", f"{base_url}/api/events"),
@@ -426,85 +953,68 @@ def main() -> None:
         if unknown:
             raise SystemExit(f"Unknown endpoints: {', '.join(sorted(unknown))}")
         endpoints = [e for e in endpoints if e[0] in endpoint_filter]
+    # Headers, body and script paths only depend on the endpoint: build them once,
+    # so each run below varies nothing but the concurrency.
+    prepared = [
+        _make_endpoint(name, method, url, driver=args.driver, hot_user_id=args.hot_user_id, post_body=post_body)
+        for name, method, url in endpoints
+    ]
 
-    results: list[RunResult] = []
-
-    for events in datasets:
-        seed_dataset(args.python, events, args.hot_user_id)
-
-        for endpoint_name, method, url in endpoints:
-            for c in concurrencies:
-                n = 10 * c
-
-                headers = [
-                    f"X-User-Id: {args.hot_user_id if endpoint_name != 'events' else 1}",
-                    "Accept: application/json",
-                ]
-
-                body_path = post_body if method == "POST" else None
-                content_type = "application/json" if method == "POST" else None
-
-                cpu_before = ws_before = None
-                cpu_after = ws_after = None
-                if args.server_pid:
-                    cpu_before, ws_before = _get_process_snapshot_windows(args.server_pid)
+    results: list[RunResult] = _load_results(out_dir / "results.jsonl") if args.append else []
 
-                output = run_ab(
-                    ab,
-                    method=method,
-                    url=url,
+    writer = _ResultWriter(out_dir, append=args.append)
+    try:
+        for i, events in enumerate(datasets):
+            seeded = seed_dataset(
+                args.python,
+                events,
+                args.hot_user_id,
+                tmp_dir=tmp_dir,
+                # Incrementally, --reseed only rebuilds the first (smallest) dataset; the
+                # rest grow from it.
+                force=args.reseed and (i == 0 or not args.incremental_seed),
+                incremental=args.incremental_seed,
+            )
+            if not seeded:
+                print(f"[{events:,}] dataset already seeded; skipping (use --reseed to force)")
+            if any(endpoint.name == "events" for endpoint in prepared):
+                # Before the runs start, so an interrupted sweep still forces a reseed.
+                mark_seed_dirty(tmp_dir)
+
+            # Each ab run is an independent blocking subprocess; with --parallel > 1 several
+            # clients press the server at once against the same seeded dataset.
+            # The dataset size travels with each task rather than being read from the loop.
+            tasks = [(events, endpoint, c) for endpoint in prepared for c in concurrencies]
+
+            def _task(task: tuple[int, _Endpoint, int]) -> RunResult:
+                dataset_events, endpoint, c = task
+                return _run_one(
+                    tool,
+                    driver=args.driver,
+                    duration_s=args.duration,
+                    events=dataset_events,
+                    endpoint=endpoint,
                     concurrency=c,
-                    requests=n,
-                    headers=headers,
-                    body_path=body_path,
-                    content_type=content_type,
-                )
-                parsed = parse_ab_output(output)
-
-                if args.server_pid:
-                    cpu_after, ws_after = _get_process_snapshot_windows(args.server_pid)
-
-                cpu_seconds = None
-                working_set_mb = None
-                if cpu_before is not None and cpu_after is not None:
-                    cpu_seconds = max(0.0, cpu_after - cpu_before)
-                if ws_after is not None:
-                    working_set_mb = ws_after
-
-                results.append(
-                    RunResult(
-                        timestamp_utc=_utc_now(),
-                        dataset_events=events,
-                        endpoint=endpoint_name,
-                        method=method,
-                        url=url,
-                        concurrency=c,
-                        requests=n,
-                        rps=parsed["rps"],
-                        time_per_request_ms_mean=parsed["tpr_ms_mean"],
-                        time_per_request_ms_mean_across=parsed["tpr_ms_mean_across"],
-                        conn_total_ms_min=parsed["conn_total_ms_min"],
-                        conn_total_ms_mean=parsed["conn_total_ms_mean"],
-                        conn_total_ms_median=parsed["conn_total_ms_median"],
-                        conn_total_ms_max=parsed["conn_total_ms_max"],
-                        p50_ms=parsed["p50_ms"],
-                        p90_ms=parsed["p90_ms"],
-                        p95_ms=parsed["p95_ms"],
-                        p99_ms=parsed["p99_ms"],
-                        cpu_seconds=cpu_seconds,
-                        working_set_mb=working_set_mb,
-                        notes="",
-                    )
+                    sample_process=sample_process,
                 )
 
-                print(
-                    f"[{events:,}] {endpoint_name} c={c} n={n} rps={parsed['rps']} mean_ms={parsed['tpr_ms_mean']}"
-                )
+            if args.parallel > 1:
+                with ThreadPoolExecutor(max_workers=args.parallel) as pool:
+                    for r in pool.map(_task, tasks):
+                        writer.write(r)
+                        results.append(r)
+            else:
+                for r in map(_task, tasks):
+                    writer.write(r)
+                    results.append(r)
+    finally:
+        writer.close()
 
     if not results:
         raise SystemExit("No results produced.")
 
-    write_report(results, out_dir)
+    # One timestamp for the whole report, so report.md and report.html agree.
+    write_report(results, out_dir, generated_at=_utc_now())
     print(f"Wrote: {out_dir / 'results.csv'}")
     print(f"Wrote: {out_dir / 'report.md'}")
     print(f"Wrote: {out_dir / 'report.html'}")
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from .run import RunResult, parse_ab_output, parse_wrk_output, write_report
+
+TESTDATA = Path(__file__).resolve().parent / "testdata"
+
+
+class ParseOutputTests(SimpleTestCase):
+    def test_parse_ab_output(self):
+        parsed = parse_ab_output((TESTDATA / "ab_feed.txt").read_bytes())
+
+        self.assertEqual(
+            parsed,
+            {
+                "rps": 3812.45,
+                "tpr_ms_mean": 52.459,
+                "tpr_ms_mean_across": 0.262,
+                "conn_total_ms_min": 4,
+                "conn_total_ms_mean": 51,
+                "conn_total_ms_median": 50,
+                "conn_total_ms_max": 121,
+                "p50_ms": 50,
+                "p90_ms": 65,
+                "p95_ms": 71,
+                "p99_ms": 88,
+            },
+        )
+
+    def test_parse_wrk_output(self):
+        # The wrk fixtures are hand-written to wrk's printf layout (thread stats,
+        # --latency distribution, summary), not captured from a live run.
+        parsed = parse_wrk_output((TESTDATA / "wrk_feed.txt").read_bytes())
+
+        # wrk has no connection-time table or p95; max latency and mean come from
+        # the thread stats, the across-all figure from Requests/sec.
+        self.assertEqual(
+            parsed,
+            {
+                "rps": 3796.3,
+                "tpr_ms_mean": 52.71,
+                "tpr_ms_mean_across": 0.263,
+                "conn_total_ms_min": None,
+                "conn_total_ms_mean": None,
+                "conn_total_ms_median": None,
+                "conn_total_ms_max": 1210,
+                "p50_ms": 50,
+                "p90_ms": 65,
+                "p95_ms": None,
+                "p99_ms": 88,
+                "requests": 38001,
+            },
+        )
+
+    def test_parse_wrk_output_with_errors_and_mixed_units(self):
+        # Socket-error and non-2xx lines sit between the request count and
+        # Requests/sec; latencies switch between us, ms and s.
+        parsed = parse_wrk_output((TESTDATA / "wrk_feed_errors.txt").read_bytes())
+
+        self.assertEqual(
+            parsed,
+            {
+                "rps": 2070.26,
+                "tpr_ms_mean": 0.812,
+                "tpr_ms_mean_across": 0.483,
+                "conn_total_ms_min": None,
+                "conn_total_ms_mean": None,
+                "conn_total_ms_median": None,
+                "conn_total_ms_max": 2000,
+                "p50_ms": 0,
+                "p90_ms": 1,
+                "p95_ms": None,
+                "p99_ms": 1870,
+                "requests": 20744,
+            },
+        )
+
+    def test_unparseable_output_yields_nones(self):
+        for parse in (parse_ab_output, parse_wrk_output):
+            parsed = parse(b"apr_socket_recv: Connection refused (111)\n")
+            self.assertEqual(parsed["rps"], None)
+            self.assertEqual(parsed["p99_ms"], None)
+
+
+class ReportTests(SimpleTestCase):
+    def test_report_html_keeps_large_dataset_sizes_exact(self):
+        result = RunResult(
+            timestamp_utc="2026-01-01T00:00:00Z",
+            dataset_events=20_000_001,
+            endpoint="/api/feed",
+            method="GET",
+            url="http://127.0.0.1:8000/api/feed",
+            concurrency=50,
+            requests=1000,
+            rps=3812.45,
+            time_per_request_ms_mean=52.459,
+            time_per_request_ms_mean_across=0.262,
+            conn_total_ms_min=None,
+            conn_total_ms_mean=None,
+            conn_total_ms_median=None,
+            conn_total_ms_max=None,
+            p50_ms=None,
+            p90_ms=None,
+            p95_ms=None,
+            p99_ms=None,
+            cpu_seconds=None,
+            working_set_mb=None,
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            write_report([result], Path(tmp), generated_at="2026-01-01T00:00:00Z")
+            html = (Path(tmp) / "report.html").read_text(encoding="utf-8")
+
+        # float32 would round 20,000,001 to 20,000,000.
+        self.assertIn("const datasetEvents = [20000001];", html)
+        self.assertIn("const concurrency = [50];", html)